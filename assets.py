@@ -0,0 +1,41 @@
+import os
+from functools import lru_cache
+from PIL import Image, ImageFont
+
+# Registro de recursos del proceso: cada fuente, plantilla y logo se decodifica una sola vez.
+# Las imágenes devueltas son compartidas; quien vaya a dibujar sobre ellas debe hacer .copy()
+
+@lru_cache(maxsize=None)
+def get_font(font_path, size):
+    return ImageFont.truetype(font_path, size)
+
+@lru_cache(maxsize=None)
+def get_image(path, mode=None):
+    image = Image.open(path)
+    if mode and image.mode != mode:
+        image = image.convert(mode)
+    image.load()
+    return image
+
+@lru_cache(maxsize=None)
+def get_optional_image(path, mode=None):
+    if not os.path.exists(path):
+        return None
+    return get_image(path, mode)
+
+@lru_cache(maxsize=None)
+def get_resized_to_width(path, width, mode=None):
+    image = get_image(path, mode)
+    ratio = image.height / image.width
+    return image.resize((width, int(width * ratio)), Image.LANCZOS)
+
+@lru_cache(maxsize=None)
+def get_logo(logo_folder, logo, width):
+    logo_path = os.path.join(logo_folder, f"{logo}.png")
+    if not os.path.exists(logo_path):
+        return None
+    return get_resized_to_width(logo_path, width, "RGBA")
+
+def clear_assets():
+    for cached in (get_font, get_image, get_optional_image, get_resized_to_width, get_logo):
+        cached.cache_clear()
@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import threading
+from datetime import datetime, timedelta
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pandas as pd
+from PIL import Image, ImageDraw
+
+from utils import download_image, download_images, create_session
+from loader import load_rows
+from drawing import create_final_image, create_final_images, create_square_image, warm_up
+from themes import THEMES, VARIANTS
+from constants import font_path, square_template_path, startup_budget_s
+
+# Benchmark del pipeline descarga -> rembg -> render con una planilla sintética y un
+# servidor HTTP local. Uso: python benchmark.py --rows 60 [--baseline bench_results/x.json]
+
+BRANDS = ['nike', 'adidas', 'puma', 'jordan', 'vans', 'reebok', '']
+SIZES = ['7.5...12 13', '4...13 14', '38..42', 'S M L XL', '6...10', '']
+TYPES = ['', '', 'talla', 'dimensiones']
+
+parser = argparse.ArgumentParser(description='Benchmark the promo image pipeline.')
+parser.add_argument('--rows', type=int, default=30, help='Rows in the synthetic spreadsheet')
+parser.add_argument('--image-size', type=int, default=1000, help='Side in px of the synthetic source photos')
+parser.add_argument('--download-workers', type=int, default=8, help='Workers for the concurrent download stage')
+parser.add_argument('--skip-rembg', action='store_true', help='Do not time remove_background (copies the downloads instead)')
+parser.add_argument('--output', default=None, help='Where to write the JSON results (default: bench_results/<timestamp>.json)')
+parser.add_argument('--baseline', default=None, help='Previous results file to compare against')
+parser.add_argument('--threshold', type=float, default=0.10, help='Relative slowdown reported as a regression')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--startup-budget', type=float, default=startup_budget_s, help='Seconds "import main" may take before it is reported')
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo reporta en KB y macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    low, high = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+def synthetic_photo(path, size, rng, fmt):
+    # Zapatilla genérica: una forma de color sobre fondo claro, suficiente para rembg y Pillow
+    image = Image.new("RGB", (size, size), (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    color = tuple(rng.randrange(30, 220) for _ in range(3))
+    draw.ellipse((size * 0.1, size * 0.45, size * 0.9, size * 0.8), fill=color)
+    draw.rectangle((size * 0.2, size * 0.3, size * 0.55, size * 0.65), fill=color)
+    draw.line((size * 0.15, size * 0.75, size * 0.85, size * 0.75), fill=(255, 255, 255), width=max(2, size // 60))
+    image.save(path, fmt)
+
+def generate_fixture(work_dir, rows, image_size, seed):
+    rng = random.Random(seed)
+    served_dir = os.path.join(work_dir, "served")
+    os.makedirs(served_dir, exist_ok=True)
+    records = []
+    today = datetime.today()
+    for i in range(rows):
+        fmt, ext = ("JPEG", "jpg") if i % 2 else ("PNG", "png")
+        name = f"photo_{i}.{ext}"
+        synthetic_photo(os.path.join(served_dir, name), image_size, rng, fmt)
+        product_type = rng.choice(TYPES)
+        records.append({
+            'fecha': (today + timedelta(days=rng.randrange(0, 10))).strftime('%d/%m/%Y'),
+            'Nombre= Marca Modelo': f"Producto {i}",
+            'Talla': '30x20x10 cm' if product_type == 'dimensiones' else rng.choice(SIZES),
+            'Genero': rng.choice(['hombre', 'mujer', None]),
+            'Tipo': product_type,
+            'Precio de venta': rng.randrange(50_000, 2_000_000, 50),
+            'Link Foto': name,
+            'TIEMPO DE ENTREGA': rng.choice([8, 15, 25]),
+            'Logo': rng.choice(BRANDS),
+            'Imagen a la derecha': None,
+            'Full image': 'si' if rng.random() < 0.2 else 'no',
+            'Texto personalizado': rng.choice([None, 'Oferta por tiempo limitado, unidades disponibles']),
+        })
+    sheet_path = os.path.join(work_dir, "Promos Fotos Datos.xlsx")
+    pd.DataFrame(records).to_excel(sheet_path, index=False)
+    return sheet_path, served_dir
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def start_server(directory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.stages.setdefault(stage, {'latencies': [], 'wall': 0.0})['latencies'].append(time.perf_counter() - start)
+        return result
+
+    def wall(self, stage, seconds, items):
+        entry = self.stages.setdefault(stage, {'latencies': [], 'wall': 0.0})
+        entry['wall'] += seconds
+        entry['items'] = items
+
+    def summary(self):
+        results = {}
+        for stage, entry in self.stages.items():
+            latencies = entry['latencies']
+            wall = entry['wall'] or sum(latencies)
+            items = entry.get('items', len(latencies))
+            results[stage] = {
+                'items': items,
+                'total_s': round(wall, 4),
+                'images_per_s': round(items / wall, 3) if wall else None,
+                'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+                'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+                'peak_rss_mb': round(entry.get('peak_rss_mb', 0), 1),
+            }
+        return results
+
+# Arranque de main.py en un intérprete limpio con -X importtime: tiempo total y los
+# módulos que importa directamente ordenados por tiempo acumulado
+def measure_startup(top=10):
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                          cwd=repo_dir, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    # "import time:  self [us] | cumulative | imported package", anidado con 2 espacios por
+    # nivel; los hijos aparecen antes que el módulo que los importa (site, encodings, main...)
+    children, main_us, main_children = [], 0, []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == 'main':
+                main_us, main_children = int(cumulative), children
+            children = []
+        elif depth == 1:
+            children.append((name.strip(), int(cumulative)))
+    ordered = sorted(main_children, key=lambda item: -item[1])
+    return {
+        'wall_s': round(wall, 4),
+        'import_main_s': round(main_us / 1e6, 4),
+        'top_imports': [{'module': module, 'ms': round(us / 1000, 1)} for module, us in ordered[:top]],
+    }
+
+def run_benchmark(args, work_dir):
+    timer = StageTimer()
+    sheet_path, served_dir = generate_fixture(work_dir, args.rows, args.image_size, args.seed)
+    server, base_url = start_server(served_dir)
+    downloaded_dir = os.path.join(work_dir, "downloaded")
+    no_background_dir = os.path.join(work_dir, "no_background")
+    final_dir = os.path.join(work_dir, "final")
+    for path in (downloaded_dir, no_background_dir, final_dir):
+        os.makedirs(path, exist_ok=True)
+    error_log_path = os.path.join(work_dir, "error_log.txt")
+
+    try:
+        rows = timer.run('load_sheet', load_rows, sheet_path, downloaded_dir, no_background_dir)
+        timer.stages['load_sheet']['peak_rss_mb'] = peak_rss_mb()
+        n = len(rows)
+        timer.stages['load_sheet']['items'] = n
+        urls = [base_url + row.url for row in rows]
+        input_paths = [row.input_path for row in rows]
+        output_paths = [row.output_path for row in rows]
+
+        session = create_session()
+        for i, url in enumerate(urls):
+            timer.run('download_image', download_image, url, input_paths[i], error_log_path, session)
+        session.close()
+        timer.stages['download_image']['peak_rss_mb'] = peak_rss_mb()
+
+        start = time.perf_counter()
+        list(download_images(urls, input_paths, error_log_path, max_workers=args.download_workers))
+        timer.wall('download_images_concurrent', time.perf_counter() - start, n)
+        timer.stages['download_images_concurrent']['peak_rss_mb'] = peak_rss_mb()
+
+        if args.skip_rembg:
+            for i in range(n):
+                Image.open(input_paths[i]).convert("RGBA").save(output_paths[i])
+        else:
+            from image_processing import remove_background, get_session
+            timer.run('rembg_session', get_session)
+            for i in range(n):
+                timer.run('remove_background', remove_background, input_paths[i], output_paths[i], error_log_path)
+            timer.stages['remove_background']['peak_rss_mb'] = peak_rss_mb()
+
+        warm_up(font_path, sorted({theme.card_path for theme in THEMES.values()}),
+                sorted({theme.template_for(with_price) for theme in THEMES.values() for with_price in (True, False)}), square_template_path, [row.logo for row in rows])
+        for i in range(0, n, 3):
+            timer.run('create_final_image', create_final_image, rows[i:i + 3], final_dir, font_path, 'light', with_price=True)
+        timer.stages['create_final_image']['peak_rss_mb'] = peak_rss_mb()
+        for i in range(0, n, 3):
+            timer.run('create_final_images', create_final_images, rows[i:i + 3], final_dir, font_path, VARIANTS)
+        timer.stages['create_final_images']['peak_rss_mb'] = peak_rss_mb()
+        for row in rows:
+            timer.run('create_square_image', create_square_image, row, final_dir, font_path, square_template_path)
+        timer.stages['create_square_image']['peak_rss_mb'] = peak_rss_mb()
+    finally:
+        server.shutdown()
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'rows': args.rows,
+        'image_size': args.image_size,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'startup': measure_startup(),
+        'stages': timer.summary(),
+    }
+
+def print_results(results):
+    print(f"\n{'stage':<28}{'items':>7}{'img/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'rss MB':>9}")
+    for stage, s in results['stages'].items():
+        fmt = lambda v: '-' if v is None else v
+        print(f"{stage:<28}{s['items']:>7}{fmt(s['images_per_s']):>10}{fmt(s['p50_ms']):>10}{fmt(s['p95_ms']):>10}{s['peak_rss_mb']:>9}")
+    print(f"peak RSS: {results['peak_rss_mb']} MB")
+    startup = results['startup']
+    print(f"\nstartup: import main {startup['import_main_s']} s ({startup['wall_s']} s with the interpreter)")
+    for entry in startup['top_imports']:
+        print(f"  {entry['module']:<26}{entry['ms']:>10} ms")
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\nComparison with baseline from {baseline.get('timestamp')}:")
+    for stage, current in results['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous or not previous.get('images_per_s') or not current.get('images_per_s'):
+            continue
+        change = current['images_per_s'] / previous['images_per_s'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  <-- regression'
+            regressions.append(stage)
+        print(f"  {stage:<28}{previous['images_per_s']:>10} -> {current['images_per_s']:<10}({change:+.1%}){flag}")
+    return regressions
+
+def main():
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix="promo_bench_") as work_dir:
+        results = run_benchmark(args, work_dir)
+    print_results(results)
+
+    output = args.output or os.path.join("bench_results", f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {output}")
+
+    regressions = []
+    if results['startup']['import_main_s'] > args.startup_budget:
+        print(f"\nStartup over budget: import main took {results['startup']['import_main_s']} s (budget {args.startup_budget} s)")
+        regressions.append('startup')
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions += compare(results, json.load(file), args.threshold)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
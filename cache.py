@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Copia a un temporal y lo renombra: quien lea path nunca ve un archivo a medio escribir
+def copy_atomic(source_path, path):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def read_json(path, default):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+
+class DownloadCache:
+    # Guarda cada imagen una sola vez por hash del contenido descargado (objects/ab/abcdef...)
+    # y un índice url -> {sha256, etag, last_modified, checked_at} para revalidar. El índice
+    # se actualiza en memoria y se escribe una vez con save() al terminar las descargas.
+    # variant distingue versiones normalizadas distintas del mismo contenido (p. ej. tamaño máximo)
+    def __init__(self, cache_dir, ttl=0, variant=""):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.ttl = ttl
+        self.variant = variant
+        self.lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = read_json(self.index_path, {})
+        self.dirty = False
+
+    def object_path(self, sha256):
+        name = f"{sha256}-{self.variant}" if self.variant else sha256
+        return os.path.join(self.objects_dir, sha256[:2], name)
+
+    def lookup(self, url):
+        with self.lock:
+            entry = self.index.get(url)
+        if entry and os.path.exists(self.object_path(entry["sha256"])):
+            return entry
+        return None
+
+    def is_fresh(self, entry):
+        return self.ttl > 0 and time.time() - entry.get("checked_at", 0) < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, source_path, sha256, etag=None, last_modified=None):
+        object_path = self.object_path(sha256)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f"{object_path}.{threading.get_ident()}.tmp"
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, object_path)
+        entry = {"sha256": sha256, "etag": etag, "last_modified": last_modified, "checked_at": time.time()}
+        self._update(url, entry)
+        return entry
+
+    def revalidated(self, url, entry):
+        # Respuesta 304: el contenido no cambió, solo se renueva la marca de tiempo
+        entry = dict(entry, checked_at=time.time())
+        self._update(url, entry)
+        return entry
+
+    def materialize(self, entry, path):
+        copy_atomic(self.object_path(entry["sha256"]), path)
+
+    def _update(self, url, entry):
+        with self.lock:
+            self.index[url] = entry
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if self.dirty:
+                write_json_atomic(self.index_path, self.index)
+                self.dirty = False
+
+
+class ResultCache:
+    # Resultados de rembg en results/<clave>.png. El mtime de cada archivo hace de
+    # marca LRU, así varios procesos pueden compartir la caché sin un índice común
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, source_sha256, *parts):
+        return sha256_bytes("|".join((source_sha256,) + tuple(str(p) for p in parts)).encode())
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def get(self, key, output_path):
+        path = self.path(key)
+        try:
+            copy_atomic(path, output_path)
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, key, source_path):
+        tmp_path = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".png"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
@@ -4,9 +4,98 @@ base_dir = 'images'
 downloaded_dir = os.path.join(base_dir, 'downloaded')
 no_background_dir = os.path.join(base_dir, 'no_background')
 final_dir = os.path.join(base_dir, 'final')
+cache_dir = os.path.join(base_dir, 'cache')
+download_cache_dir = os.path.join(cache_dir, 'downloads')
+result_cache_dir = os.path.join(cache_dir, 'no_background')
+build_manifest_path = os.path.join(cache_dir, 'build_manifest.json')
+sheet_cache_dir = os.path.join(cache_dir, 'sheet')
+# Reporte de tiempos por ejecución (.json y .csv) y perfil de --profile
+run_report_path = os.path.join(base_dir, 'run_report')
+profile_path = os.path.join(base_dir, 'render_profile.pstats')
 
 font_path = "fonts/label_font.ttf"
 card_path = "templates/card.png"
 template_path = "templates/template.png"
 # Nueva constante para la plantilla cuadrada
 square_template_path = "templates/square_card.png"
+
+# Descargas: hilos concurrentes, conexiones simultáneas por host,
+# timeout (conexión, lectura) en segundos y reintentos con backoff exponencial
+download_workers = 16
+download_per_host = 4
+download_timeout = (5, 30)
+download_retries = 3
+download_backoff = 0.5
+# Las descargas se escriben por bloques y se cortan si superan download_max_bytes.
+# Al llegar, las imágenes se reducen una vez a download_max_dimension px en su lado mayor:
+# el doble del hueco más grande de las plantillas (500 px en la cuadrada), para que el
+# recorte de rembg y el LANCZOS final conserven detalle
+download_chunk_size = 64 * 1024
+download_max_bytes = 25 * 1024 * 1024
+download_max_dimension = 1000
+# Son archivos intermedios: compresión PNG rápida en vez de la de por defecto (6)
+download_png_compress_level = 1
+
+# Caché de descargas: dentro de este plazo (segundos) no se revalida contra el servidor.
+# Con 0 cada descarga se revalida (ETag / Last-Modified) y solo se baja de nuevo si cambió
+download_cache_ttl = 0
+
+# Eliminación de fondo: modelo de rembg, imágenes por lote, hilos de ONNX Runtime
+# (intra-op usa todos los núcleos; inter-op 1 porque el grafo se ejecuta en secuencia)
+# y tamaño máximo de la caché de resultados (LRU)
+rembg_model = "u2net"
+rembg_batch_size = 8
+rembg_intra_op_threads = os.cpu_count() or 1
+rembg_inter_op_threads = 1
+result_cache_max_bytes = 1024 * 1024 * 1024
+
+# Salida de las imágenes finales: formatos (png, webp, jpeg), nivel de compresión PNG
+# (0-9; 6 es el de Pillow), calidad de WebP/JPEG e hilos que codifican en segundo plano
+output_formats = ('png',)
+output_png_compress_level = 6
+output_quality = 90
+output_writer_threads = 2
+output_max_pending = 4
+
+# Variantes redimensionadas de las imágenes sin fondo que se guardan en memoria por proceso
+prepared_cache_size = 256
+
+# --watch: cada cuánto (segundos) se revisan la planilla, templates/ y fonts/
+watch_interval = 0.5
+
+# Tiempo máximo (segundos) que puede tardar "import main"; benchmark.py avisa si se pasa
+startup_budget_s = 1.0
+
+# Servicio HTTP (service.py): dirección, hilos que procesan trabajos, trabajos en espera
+# antes de responder 503, tamaño máximo de la subida, filas por trabajo, trabajos
+# terminados que se conservan (con sus archivos) y eliminaciones de fondo simultáneas
+service_jobs_dir = os.path.join(base_dir, 'jobs')
+service_host = '127.0.0.1'
+service_port = 8700
+service_workers = 2
+service_max_queued = 16
+service_max_upload_bytes = 20 * 1024 * 1024
+service_max_rows = 300
+service_max_jobs = 100
+service_rembg_concurrency = 1
+
+# --dedup-similar: bits distintos (de 64) del hash perceptual para considerar dos fotos iguales
+dedup_similar_distance = 4
+
+# Journal de la ejecución para --resume y cada cuánto (segundos) se escribe como mucho
+run_journal_path = os.path.join(cache_dir, 'run_journal.json')
+journal_flush_interval = 1.0
+
+# Imágenes decodificadas que se pasan en memoria entre descarga, rembg y render (handoff.py);
+# pasado el presupuesto se vuelven a leer del disco. Los PNG sin fondo son intermedios
+# (caché y depuración), así que se comprimen poco, como las descargas
+handoff_budget_bytes = 512 * 1024 * 1024
+no_background_png_compress_level = 1
+
+# --preview: carpeta, escala por defecto, calidad JPEG y hoja de contactos (columnas y
+# ancho de cada miniatura en la imagen)
+preview_dir = os.path.join(base_dir, 'preview')
+preview_scale = 0.5
+preview_quality = 70
+contact_sheet_columns = 6
+contact_sheet_tile_width = 240
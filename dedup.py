@@ -0,0 +1,100 @@
+import os
+from PIL import Image
+
+from cache import sha256_file, copy_atomic
+from instrumentation import timed
+from constants import dedup_similar_distance
+
+# Filas que usan la misma foto: la planilla repite el 'Link Foto' en variantes de color o
+# talla, y a veces la misma imagen aparece con otro link. Cada foto única se descarga y se
+# le quita el fondo una sola vez; las demás filas reciben un enlace (hardlink, o copia si el
+# sistema no lo permite) a image_{i}.png / image_no_bg_{i}.png de la fila que la procesó,
+# así el resto del pipeline sigue trabajando por fila.
+
+# Hash perceptual de 64 bits (dHash): compara cada píxel con el de su derecha en una
+# miniatura en grises de 9x8, así que sobrevive a recompresiones y cambios de tamaño
+def dhash(path):
+    with Image.open(path) as image:
+        image.draft("L", (64, 64))
+        small = image.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for y in range(8):
+        for x in range(8):
+            bits = bits << 1 | (pixels[y * 9 + x] > pixels[y * 9 + x + 1])
+    return bits
+
+def _share(source, path):
+    if not os.path.exists(source):
+        return False
+    if os.path.lexists(path):
+        os.unlink(path)
+    try:
+        os.link(source, path)
+    except OSError:
+        copy_atomic(source, path)
+    return True
+
+
+class PhotoDedup:
+    # similar=True también junta fotos casi iguales (distancia de Hamming del dHash
+    # <= max_distance); por defecto solo las de contenido idéntico
+    def __init__(self, rows, similar=False, max_distance=dedup_similar_distance):
+        self.rows = rows
+        self.similar = similar
+        self.max_distance = max_distance
+        # Una descarga por link: la primera fila que lo usa
+        self.url_groups = {}
+        for row in rows:
+            self.url_groups.setdefault(row.url, []).append(row)
+        self.unique_rows = [group[0] for group in self.url_groups.values()]
+        # Un resultado sin fondo por (contenido, "Full image"): la fila que lo genera y las que lo reciben
+        self.leaders = {}    # (sha256, full_image) -> fila
+        self.followers = {}  # índice de la fila líder -> [filas]
+        self.hashes = []     # [(dhash, full_image, fila líder)] para similar=True
+
+    # Las rutas de las filas se reescriben desde cero: un hardlink de una pasada anterior
+    # (--watch) se compartiría con otra fila si se escribiera encima
+    def remove_stale_files(self):
+        for row in self.rows:
+            for path in (row.input_path, row.output_path):
+                if os.path.lexists(path):
+                    os.unlink(path)
+
+    # Se llama al terminar de descargar la foto de una fila de unique_rows. Enlaza la descarga
+    # en las demás filas del mismo link y devuelve las filas cuyo resultado hay que generar
+    # (quitar el fondo o copiar si es "Full image"); vacía si ese contenido ya se procesó
+    def add_download(self, row):
+        group = self.url_groups[row.url]
+        for other in group[1:]:
+            _share(row.input_path, other.input_path)
+        new_leaders = []
+        with timed('dedup.hash', row.input_path):
+            sha256 = sha256_file(row.input_path)
+            image_hash = dhash(row.input_path) if self.similar else None
+        for full_image in sorted({other.full_image for other in group}):
+            rows = [other for other in group if other.full_image == full_image]
+            leader = self.leaders.setdefault((sha256, full_image), rows[0])
+            if leader is rows[0] and self.similar:
+                for other_hash, other_full_image, other in self.hashes:
+                    if other_full_image == full_image and bin(image_hash ^ other_hash).count("1") <= self.max_distance:
+                        leader = self.leaders[(sha256, full_image)] = other
+                        break
+                else:
+                    self.hashes.append((image_hash, full_image, leader))
+            if leader is rows[0]:
+                new_leaders.append(leader)
+                self.followers[leader.index] = rows[1:]
+            else:
+                self.followers[leader.index].extend(rows)
+        return new_leaders
+
+    # Después de quitar los fondos: enlaza el resultado de cada foto en las filas que la usan
+    def share_results(self):
+        for leader in self.leaders.values():
+            for row in self.followers[leader.index]:
+                _share(leader.output_path, row.output_path)
+
+    def summary(self):
+        return (f"{len(self.rows)} row(s) use {len(self.url_groups)} link(s) and "
+                f"{len(set(row.index for row in self.leaders.values()))} distinct photo(s).")
@@ -0,0 +1,92 @@
+import os
+import threading
+from collections import OrderedDict
+
+from instrumentation import record
+from constants import handoff_budget_bytes
+
+# Entrega en memoria entre etapas del mismo proceso: la descarga deja la imagen ya
+# decodificada para rembg, y rembg deja el resultado para la etapa de imágenes preparadas,
+# así cada foto no se vuelve a leer del PNG que la etapa anterior acaba de escribir.
+# Los PNG se siguen escribiendo (son la caché, el journal y lo que ve quien depura), y una
+# imagen solo se guarda aquí después de que su archivo está completo en disco: si el
+# conjunto supera el presupuesto se sueltan las más viejas y esas se vuelven a leer del disco.
+# La clave es (dispositivo, inodo, mtime, tamaño), así los hardlinks de dedup.py también
+# la encuentran y un archivo reescrito no devuelve la imagen anterior.
+# Las imágenes son compartidas: no dibujar sobre ellas.
+
+_images = OrderedDict()
+_lock = threading.Lock()
+_budget = handoff_budget_bytes
+_size = 0
+
+def _key(path):
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def _nbytes(image):
+    return image.width * image.height * len(image.getbands())
+
+# Presupuesto en bytes de píxeles decodificados; 0 desactiva la entrega en memoria
+def set_budget(budget_bytes):
+    global _budget
+    with _lock:
+        _budget = budget_bytes
+    _spill()
+
+def keep(path, image):
+    global _size
+    nbytes = _nbytes(image)
+    if nbytes > _budget:
+        return
+    try:
+        key = _key(path)
+    except OSError:
+        return
+    with _lock:
+        if key in _images:
+            return
+        _images[key] = (image, nbytes, path)
+        _size += nbytes
+    _spill()
+
+def _spill():
+    global _size
+    with _lock:
+        while _images and _size > _budget:
+            _, (_, nbytes, path) = _images.popitem(last=False)
+            _size -= nbytes
+            record('handoff.spill', 0.0, path, nbytes)
+
+# La imagen decodificada de path si sigue en memoria, si no None. Con release=True se
+# suelta: la etapa que la consume es la última que la necesita
+def get(path, release=False):
+    global _size
+    try:
+        key = _key(path)
+    except OSError:
+        return None
+    with _lock:
+        entry = _images.pop(key, None) if release else _images.get(key)
+        if entry is None:
+            return None
+        if release:
+            _size -= entry[1]
+        else:
+            _images.move_to_end(key)
+    record('handoff.hit', 0.0, path, entry[1])
+    return entry[0]
+
+# Suelta todo, o con prefix solo las imágenes de rutas bajo esa carpeta (las de un trabajo
+# de service.py, sin tocar las de otros que siguen corriendo)
+def clear_handoff(prefix=None):
+    global _size
+    with _lock:
+        if prefix is None:
+            _images.clear()
+            _size = 0
+            return
+        for key, (_, nbytes, path) in list(_images.items()):
+            if path.startswith(prefix):
+                del _images[key]
+                _size -= nbytes
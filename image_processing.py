@@ -1,17 +1,184 @@
-from rembg import remove
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from importlib.metadata import version, PackageNotFoundError
+from itertools import islice
+
+import onnxruntime as ort
+from rembg import remove, new_session
+from rembg.sessions import sessions_class
 from PIL import Image
 
-def remove_background(input_path, output_path, error_log_path):
+from cache import sha256_file
+from constants import rembg_model, rembg_batch_size, rembg_intra_op_threads, rembg_inter_op_threads, no_background_png_compress_level
+from utils import log_error
+from instrumentation import timed, file_size, drain, merge
+from handoff import keep, get as get_handoff, set_budget
+
+# Una sola sesión de ONNX Runtime por proceso y por modelo
+_sessions = {}
+
+def rembg_version():
+    try:
+        return version("rembg")
+    except PackageNotFoundError:
+        return "unknown"
+
+def create_session(model_name=rembg_model, intra_op_threads=rembg_intra_op_threads, inter_op_threads=rembg_inter_op_threads):
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = intra_op_threads
+    sess_opts.inter_op_num_threads = inter_op_threads
+    sess_opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    sess_opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    for session_class in sessions_class:
+        if session_class.name() == model_name:
+            return session_class(model_name, sess_opts, providers=["CPUExecutionProvider"])
+    return new_session(model_name)
+
+def get_session(model_name=rembg_model):
+    if model_name not in _sessions:
+        _sessions[model_name] = create_session(model_name)
+    return _sessions[model_name]
+
+def _log_failure(input_path, error_log_path, e):
+    error_message = f"Failed to process image {input_path}. Reason: {e}\n\n"
+    log_error(error_log_path, error_message)
+    print(error_message.strip())
+
+def _cache_key(cache, input_path, model_name):
+    return cache.key(sha256_file(input_path), model_name, rembg_version())
+
+def remove_background(input_path, output_path, error_log_path, cache=None, model_name=rembg_model):
     try:
-        input_image = Image.open(input_path)
-        output_image = remove(input_image)
-        cropped_image = crop_image(output_image)
-        cropped_image.save(output_path)
+        if cache:
+            with timed('rembg.cache_lookup', input_path):
+                key = _cache_key(cache, input_path, model_name)
+                hit = cache.get(key, output_path)
+            if hit:
+                return
+        with timed('rembg.decode', input_path, file_size(input_path)):
+            input_image = _load(input_path)
+        with timed('rembg.inference', input_path):
+            output_image = remove(input_image, session=get_session(model_name))
+            cropped_image = crop_image(output_image)
+        _save(cropped_image, output_path, cache, key if cache else None)
     except Exception as e:
-        error_message = f"Failed to process image {input_path}. Reason: {e}\n\n"
-        with open(error_log_path, "a") as log_file:
-            log_file.write(error_message)
-        print(error_message.strip())
+        _log_failure(input_path, error_log_path, e)
+
+def _load(input_path):
+    image = get_handoff(input_path, release=True)
+    if image is not None:
+        return image
+    image = Image.open(input_path)
+    image.load()
+    return image
+
+def _timed_load(input_path):
+    with timed('rembg.decode', input_path, file_size(input_path)):
+        return _load(input_path)
+
+def _save(image, output_path, cache, key):
+    tmp_path = f"{output_path}.tmp"
+    with timed('rembg.encode', output_path):
+        try:
+            image.save(tmp_path, "PNG", compress_level=no_background_png_compress_level)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    # Con el archivo ya completo, el render la toma de memoria (ver handoff.py)
+    keep(output_path, image)
+    if cache:
+        cache.put(key, output_path)
+
+# Consume (input_path, output_path) por lotes con la misma sesión: mientras el modelo
+# procesa un lote, un pool de hilos decodifica el siguiente y codifica los PNG del anterior
+def remove_backgrounds(jobs, error_log_path, cache=None, model_name=rembg_model, batch_size=rembg_batch_size, progress=None, on_done=None):
+    session = get_session(model_name)
+    jobs = iter(jobs)
+    pending_saves = []
+    with ThreadPoolExecutor(max_workers=2) as io_pool:
+        while True:
+            chunk = list(islice(jobs, batch_size))
+            if not chunk:
+                break
+            batch = []
+            for input_path, output_path in chunk:
+                try:
+                    key = _cache_key(cache, input_path, model_name) if cache else None
+                    if key and cache.get(key, output_path):
+                        _advance(progress)
+                        _finish(on_done, input_path, output_path)
+                        continue
+                    batch.append((input_path, output_path, key, io_pool.submit(_timed_load, input_path)))
+                except Exception as e:
+                    _log_failure(input_path, error_log_path, e)
+                    _advance(progress)
+                    _finish(on_done, input_path, output_path)
+
+            for input_path, output_path, key, loaded in batch:
+                try:
+                    input_image = loaded.result()
+                    with timed('rembg.inference', input_path):
+                        output_image = crop_image(remove(input_image, session=session))
+                    pending_saves.append((input_path, output_path, io_pool.submit(_save, output_image, output_path, cache, key)))
+                except Exception as e:
+                    _log_failure(input_path, error_log_path, e)
+                    _finish(on_done, input_path, output_path)
+                _advance(progress)
+            pending_saves = _drain(pending_saves, error_log_path, block=False, on_done=on_done)
+        _drain(pending_saves, error_log_path, block=True, on_done=on_done)
+
+def _advance(progress):
+    if progress is not None:
+        progress.update(1)
+
+# on_done(input_path, output_path) avisa que esa imagen terminó, bien o mal: el resultado
+# se escribe con temporal + rename, así que existe solo si salió bien
+def _finish(on_done, input_path, output_path):
+    if on_done is not None:
+        on_done(input_path, output_path)
+
+def _init_worker(model_name, intra_op_threads):
+    # El render corre en el proceso principal: aquí guardarlas en memoria no sirve de nada
+    set_budget(0)
+    _sessions[model_name] = create_session(model_name, intra_op_threads=intra_op_threads)
+
+# Se ejecuta en el proceso hijo y devuelve sus mediciones al proceso principal
+def _remove_background_task(*args):
+    drain()  # descarta lo heredado del proceso padre al hacer fork
+    remove_background(*args)
+    return drain()
+
+# Reparte los trabajos entre procesos a medida que llegan (la cola del executor hace de
+# buffer entre descargas e inferencia). Cada proceso carga su propia sesión y los hilos
+# de ONNX Runtime se reparten entre procesos para no sobresuscribir los núcleos
+def remove_backgrounds_parallel(jobs, error_log_path, cache=None, model_name=rembg_model, workers=None, progress=None, on_done=None):
+    workers = workers or os.cpu_count() or 1
+    intra_op_threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_name, intra_op_threads)) as pool:
+        futures = []
+        for input_path, output_path in jobs:
+            future = pool.submit(_remove_background_task, input_path, output_path, error_log_path, cache, model_name)
+            def done(_, input_path=input_path, output_path=output_path):
+                _advance(progress)
+                _finish(on_done, input_path, output_path)
+            future.add_done_callback(done)
+            futures.append(future)
+        for future in futures:
+            merge(future.result())
+
+def _drain(pending_saves, error_log_path, block, on_done=None):
+    remaining = []
+    for input_path, output_path, future in pending_saves:
+        if not block and not future.done():
+            remaining.append((input_path, output_path, future))
+            continue
+        try:
+            future.result()
+        except Exception as e:
+            _log_failure(input_path, error_log_path, e)
+        _finish(on_done, input_path, output_path)
+    return remaining
 
 def crop_image(image):
     return image.convert("RGBA").crop(image.getbbox())
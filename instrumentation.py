@@ -0,0 +1,99 @@
+import os
+import csv
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Mediciones del proceso actual: (etapa, elemento, segundos, bytes). Los procesos del
+# pool devuelven las suyas con drain() y el proceso principal las junta con merge()
+_records = []
+_lock = threading.Lock()
+
+def record(stage, seconds, item=None, nbytes=None):
+    with _lock:
+        _records.append((stage, item, seconds, nbytes))
+
+@contextmanager
+def timed(stage, item=None, nbytes=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, item, nbytes)
+
+# Cronómetro por vueltas para medir bloques consecutivos sin anidar "with"
+class Laps:
+    def __init__(self, prefix, item=None):
+        self.prefix = prefix
+        self.item = item
+        self.last = time.perf_counter()
+
+    def lap(self, stage, nbytes=None):
+        now = time.perf_counter()
+        record(f"{self.prefix}.{stage}", now - self.last, self.item, nbytes)
+        self.last = now
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+# Saca las mediciones acumuladas. Con prefix solo las de elementos bajo esa ruta (las de
+# un trabajo de service.py, mientras otros siguen midiendo); las demás quedan
+def drain(prefix=None):
+    with _lock:
+        if prefix is None:
+            records = list(_records)
+            _records.clear()
+        else:
+            records = [r for r in _records if isinstance(r[1], str) and r[1].startswith(prefix)]
+            _records[:] = [r for r in _records if not (isinstance(r[1], str) and r[1].startswith(prefix))]
+    return records
+
+def merge(records):
+    with _lock:
+        _records.extend(records)
+
+def summarize(records):
+    stages = {}
+    for stage, _, seconds, nbytes in records:
+        entry = stages.setdefault(stage, {'count': 0, 'total_s': 0.0, 'max_ms': 0.0, 'bytes': 0, 'latencies': []})
+        entry['count'] += 1
+        entry['total_s'] += seconds
+        entry['max_ms'] = max(entry['max_ms'], seconds * 1000)
+        entry['bytes'] += nbytes or 0
+        entry['latencies'].append(seconds)
+    for entry in stages.values():
+        latencies = sorted(entry.pop('latencies'))
+        entry['mean_ms'] = round(entry['total_s'] / entry['count'] * 1000, 3)
+        entry['p95_ms'] = round(latencies[int((len(latencies) - 1) * 0.95)] * 1000, 3)
+        entry['total_s'] = round(entry['total_s'], 4)
+        entry['max_ms'] = round(entry['max_ms'], 3)
+    return stages
+
+# Escribe <report_path>.json (resumen por etapa + mediciones) y <report_path>.csv (mediciones)
+def write_report(report_path, started_at, wall_seconds):
+    records = drain()
+    stages = summarize(records)
+    report = {
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'wall_s': round(wall_seconds, 3),
+        'stages': stages,
+        'records': [{'stage': s, 'item': i, 'seconds': round(sec, 6), 'bytes': b} for s, i, sec, b in records],
+    }
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(f"{report_path}.json", "w") as file:
+        json.dump(report, file, indent=1)
+    with open(f"{report_path}.csv", "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(['stage', 'item', 'seconds', 'bytes'])
+        for stage, item, seconds, nbytes in records:
+            writer.writerow([stage, item, f"{seconds:.6f}", '' if nbytes is None else nbytes])
+    return stages
+
+def print_summary(stages, limit=12):
+    print(f"{'stage':<32}{'count':>7}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}")
+    for stage, entry in sorted(stages.items(), key=lambda kv: -kv[1]['total_s'])[:limit]:
+        print(f"{stage:<32}{entry['count']:>7}{entry['total_s']:>10}{entry['mean_ms']:>10}{entry['p95_ms']:>10}")
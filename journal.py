@@ -0,0 +1,80 @@
+import os
+import time
+import threading
+from datetime import datetime
+
+from cache import read_json, write_json_atomic
+from constants import journal_flush_interval
+
+# Avance de la ejecución por fila: descarga -> sin fondo -> cada imagen renderizada. Se
+# escribe de forma atómica a medida que termina el trabajo (como mucho cada
+# journal_flush_interval segundos), así que si el proceso muere, "main.py --resume" retoma
+# donde quedó. Como todos los archivos se escriben con temporal + rename, que una etapa
+# figure hecha y su archivo exista basta para saltearla.
+
+DONE = 'done'
+FAILED = 'failed'
+
+
+class RunJournal:
+    def __init__(self, path, model_name, resume=False):
+        self.path = path
+        self.model_name = model_name
+        self.lock = threading.Lock()
+        data = read_json(path, {}) if resume else {}
+        # Con otro modelo de rembg las imágenes sin fondo ya no sirven
+        self.resumed = bool(data) and data.get('rembg_model') == model_name
+        self.rows = data.get('rows', {}) if self.resumed else {}
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.dirty = False
+        self.last_flush = 0.0
+
+    # La entrada de una fila vale mientras la fila siga teniendo el mismo link y modo
+    def _entry(self, row):
+        entry = self.rows.get(str(row.index))
+        if entry is None or (entry['url'], entry['full_image']) != (row.url, row.full_image):
+            entry = self.rows[str(row.index)] = {'url': row.url, 'full_image': row.full_image, 'stages': {}}
+        return entry
+
+    def mark(self, row, stage, ok):
+        with self.lock:
+            self._entry(row)['stages'][stage] = DONE if ok else FAILED
+            self.dirty = True
+
+    def is_done(self, row, stage):
+        with self.lock:
+            return self._entry(row)['stages'].get(stage) == DONE
+
+    # Filas a las que todavía les falta la imagen sin fondo (nuevas, cambiadas o que fallaron)
+    def pending(self, rows):
+        return [row for row in rows if not (self.is_done(row, 'no_background') and os.path.exists(row.output_path))]
+
+    # Filas con alguna etapa fallida, como [(fila, [etapas])]
+    def failures(self, rows):
+        failed = []
+        for row in rows:
+            with self.lock:
+                stages = [stage for stage, state in self._entry(row)['stages'].items() if state == FAILED]
+            if stages:
+                failed.append((row, stages))
+        return failed
+
+    # Escribe el journal si hubo cambios y pasó el intervalo (o siempre con force).
+    # Devuelve True si escribió
+    def flush(self, force=False, finished=False):
+        with self.lock:
+            now = time.monotonic()
+            if not (self.dirty or finished) or (not force and now - self.last_flush < journal_flush_interval):
+                return False
+            data = {
+                'rembg_model': self.model_name,
+                'started_at': self.started_at,
+                'updated_at': datetime.now().isoformat(timespec='seconds'),
+                'finished': finished,
+                'rows': self.rows,
+            }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            write_json_atomic(self.path, data)
+            self.dirty = False
+            self.last_flush = now
+            return True
@@ -0,0 +1,195 @@
+import os
+import math
+from datetime import datetime
+from typing import NamedTuple, Optional, Union
+
+from cache import sha256_file, read_json, write_json_atomic
+from sizes import SizeChips, size_chips
+
+# Columnas de 'Promos Fotos Datos.xlsx' y el tipo con que se leen
+SHEET_DTYPES = {
+    'Nombre= Marca Modelo': str,
+    'Talla': str,
+    'Genero': str,
+    'Tipo': str,
+    'Link Foto': str,
+    'Logo': str,
+    'Full image': str,
+    'Texto personalizado': str,
+}
+# Sin estas columnas la fila no se puede dibujar
+REQUIRED_COLUMNS = ['Link Foto', 'Precio de venta', 'TIEMPO DE ENTREGA']
+# Sube cuando cambie la normalización, para no leer cachés con el formato anterior
+SHEET_CACHE_VERSION = 2
+
+
+class PromoRow(NamedTuple):
+    index: int
+    url: str
+    price: float
+    delivery_time: Union[int, str]
+    size: str
+    gender: str
+    type: str
+    date: Optional[datetime]
+    logo: str
+    custom_text: str
+    full_image: bool
+    chips: SizeChips
+    input_path: str
+    output_path: str
+
+
+# pandas (y numpy) se importan solo al leer el .xlsx: con la caché de la planilla al día,
+# un render no los carga
+def _read_excel(file_path):
+    import pandas as pd
+    try:
+        return pd.read_excel(file_path, header=0, dtype=SHEET_DTYPES, engine='calamine')
+    except (ImportError, ValueError):
+        return pd.read_excel(file_path, header=0, dtype=SHEET_DTYPES)
+
+def _text(column, default=''):
+    return column.fillna(default).astype(str).str.strip()
+
+# Normaliza toda la hoja de una vez, columna por columna, y descarta filas enteras cuando
+# les falta un dato obligatorio (antes cada columna se filtraba por separado y las filas
+# podían desalinearse)
+def normalize_sheet(df):
+    import numpy as np
+    import pandas as pd
+    df = df.assign(**{'Precio de venta': pd.to_numeric(df['Precio de venta'], errors='coerce')})
+    df = df.dropna(subset=REQUIRED_COLUMNS).reset_index(drop=True)
+    delivery = df['TIEMPO DE ENTREGA']
+    delivery_days = pd.to_numeric(delivery, errors='coerce')
+    sizes = _text(df['Talla'])
+    return pd.DataFrame({
+        'url': _text(df['Link Foto']),
+        'price': df['Precio de venta'].astype(float),
+        'delivery_days': np.trunc(delivery_days).astype('Int64'),
+        'delivery_text': _text(delivery).str.lower().where(delivery_days.isna(), ''),
+        'size': sizes.mask(sizes.str.lower() == 'nan', ''),
+        'gender': _text(df['Genero'], 'hombre').replace('', 'hombre'),
+        'type': _text(df['Tipo']),
+        'date': pd.to_datetime(df['fecha'], format='%d/%m/%Y', errors='coerce'),
+        'logo': _text(df['Logo']),
+        'custom_text': _text(df['Texto personalizado']),
+        'full_image': _text(df['Full image']).str.lower() == 'si',
+    })
+
+# Filas normalizadas como registros de Python simples (fecha en ISO)
+def sheet_records(frame):
+    import pandas as pd
+    records = []
+    for record in frame.itertuples(index=False):
+        records.append({
+            'url': record.url,
+            'price': float(record.price),
+            'delivery_time': int(record.delivery_days) if not pd.isna(record.delivery_days) else record.delivery_text,
+            'size': record.size,
+            'gender': record.gender,
+            'type': record.type,
+            'date': None if pd.isna(record.date) else record.date.strftime('%Y-%m-%d'),
+            'logo': record.logo,
+            'custom_text': record.custom_text,
+            'full_image': bool(record.full_image),
+        })
+    return records
+
+# Solo la entrada de la planilla actual puede volver a servir: al escribirla se borran las
+# de versiones anteriores de la planilla y las de otros formatos de caché (.parquet, .vN.json)
+def _prune_sheet_cache(cache_dir, cache_path):
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if path != cache_path and name.endswith(('.json', '.parquet')):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+# Copia normalizada en JSON junto a la caché, indexada por el hash del .xlsx
+def _cached_records(file_path, cache_dir):
+    if cache_dir is None:
+        return sheet_records(normalize_sheet(_read_excel(file_path)))
+    cache_path = os.path.join(cache_dir, f"{sha256_file(file_path)}.v{SHEET_CACHE_VERSION}.json")
+    records = read_json(cache_path, None)
+    if records is not None:
+        return records
+    records = sheet_records(normalize_sheet(_read_excel(file_path)))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_json_atomic(cache_path, records)
+        _prune_sheet_cache(cache_dir, cache_path)
+    except OSError:
+        pass
+    return records
+
+def _json_text(data, key, default=''):
+    return str(data.get(key) or default).strip()
+
+# Registro recibido como JSON (p. ej. desde service.py) con las mismas claves y valores
+# por defecto que deja normalize_sheet. Fecha en '%Y-%m-%d' o '%d/%m/%Y'
+def record_from_json(data):
+    missing = [key for key in ('url', 'price', 'delivery_time') if data.get(key) in (None, '')]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    # json.loads acepta NaN e Infinity, y float(True) es 1.0: ninguno es un precio
+    try:
+        if isinstance(data['price'], bool):
+            raise ValueError
+        price = float(data['price'])
+        if not math.isfinite(price):
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f"price '{data['price']}' is not a number")
+    delivery_time = data['delivery_time']
+    try:
+        delivery_time = int(float(delivery_time))
+    except (TypeError, ValueError):
+        delivery_time = str(delivery_time).strip().lower()
+    date = str(data.get('date') or '').strip()
+    if date:
+        for date_format in ('%Y-%m-%d', '%d/%m/%Y'):
+            try:
+                date = datetime.strptime(date, date_format).strftime('%Y-%m-%d')
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"date '{date}' is not YYYY-MM-DD or DD/MM/YYYY")
+    return {
+        'url': _json_text(data, 'url'),
+        'price': price,
+        'delivery_time': delivery_time,
+        'size': _json_text(data, 'size'),
+        'gender': _json_text(data, 'gender', 'hombre'),
+        'type': _json_text(data, 'type'),
+        'date': date or None,
+        'logo': _json_text(data, 'logo'),
+        'custom_text': _json_text(data, 'custom_text'),
+        'full_image': _json_text(data, 'full_image').lower() in ('si', 'true'),
+    }
+
+def rows_from_records(records, downloaded_dir, no_background_dir):
+    rows = []
+    for i, record in enumerate(records):
+        rows.append(PromoRow(
+            index=i,
+            url=record['url'],
+            price=record['price'],
+            delivery_time=record['delivery_time'],
+            size=record['size'],
+            gender=record['gender'],
+            type=record['type'],
+            date=datetime.strptime(record['date'], '%Y-%m-%d') if record['date'] else None,
+            logo=record['logo'],
+            custom_text=record['custom_text'],
+            full_image=record['full_image'],
+            chips=size_chips(record['size'], record['type']),
+            input_path=os.path.join(downloaded_dir, f"image_{i}.png"),
+            output_path=os.path.join(no_background_dir, f"image_no_bg_{i}.png"),
+        ))
+    return rows
+
+def load_rows(file_path, downloaded_dir, no_background_dir, cache_dir=None):
+    return rows_from_records(_cached_records(file_path, cache_dir), downloaded_dir, no_background_dir)
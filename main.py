@@ -1,121 +1,403 @@
-import pandas as pd
+import time
+_import_start = time.perf_counter()
+
 import os
 import argparse
 from tqdm import tqdm
-import webbrowser
+from PIL import Image
 from datetime import datetime
-import shutil
+import traceback
+
+from utils import clear_directory, download_images, log_error
+from dedup import PhotoDedup
+from journal import RunJournal
+from loader import load_rows
+from sizes import malformed_sizes
+from cache import DownloadCache, ResultCache, copy_atomic
+from drawing import create_final_images, create_square_image, warm_up, final_image_path, square_image_path, final_image_fingerprint, square_image_fingerprint
+from manifest import BuildManifest
+from assets import clear_assets
+from sprites import clear_sprites
+from typeset import clear_typeset
+from watch import snapshot, wait_for_change
+from instrumentation import record, timed, write_report, print_summary
+from scheduler import RenderTask, run_render_tasks, report_errors
+from prepared import prepare_images, set_resample
+from preview import write_contact_sheet
+from handoff import set_budget, clear_handoff
+from themes import THEMES, VARIANTS
+from output import OutputOptions, parse_formats, format_paths, wait_for_writes, print_output_summary
+from constants import base_dir, downloaded_dir, no_background_dir, final_dir, font_path, square_template_path, download_workers, download_cache_dir, download_cache_ttl, result_cache_dir, result_cache_max_bytes, rembg_model, rembg_batch_size, build_manifest_path, run_journal_path, sheet_cache_dir, run_report_path, profile_path, download_max_dimension, output_formats, output_png_compress_level, output_quality, watch_interval, handoff_budget_bytes, preview_dir, preview_scale, preview_quality
 
-from utils import clear_directory, download_image
-from image_processing import remove_background
-from drawing import create_final_image, create_square_image
-from constants import base_dir, downloaded_dir, no_background_dir, final_dir, font_path, card_path, template_path, square_template_path
+# Lo pesado (rembg/onnxruntime, requests, pandas, cProfile, webbrowser) se importa en la etapa
+# que lo usa, para que un render con la caché de la planilla al día arranque rápido
+IMPORT_SECONDS = time.perf_counter() - _import_start
 
 # Parse command-line arguments
 parser = argparse.ArgumentParser(description='Process images for promotions.')
 parser.add_argument('--skip-download', action='store_true', help='Skip downloading and processing images')
 parser.add_argument('--imagenes-cuadradas', action='store_true', help='Crear imágenes cuadradas en images/final/cuadradas')
-args = parser.parse_args()
-
-# Load the Excel file
-file_path = 'Promos Fotos Datos.xlsx'
-df = pd.read_excel(file_path, header=0)
-
-# Extract the relevant columns
-urls = df['Link Foto'].dropna().tolist()
-prices = df['Precio de venta'].dropna().astype(float).tolist()
-delivery_times = df['TIEMPO DE ENTREGA'].dropna().tolist()
-sizes = df['Talla'].astype(str).tolist()  # Convert to string
-genders = df['Genero'].fillna('hombre').tolist()  # Fill missing values with 'hombre'
-types = df['Tipo'].fillna('').tolist()  # Fill missing values with empty string
-dates = df['fecha'].apply(lambda date: pd.to_datetime(date, format='%d/%m/%Y', dayfirst=True, errors='coerce')).tolist()
-logos = df['Logo'].fillna('').tolist()  # Extract logos column and fill missing values with an empty string
-custom_texts = df['Texto personalizado'].fillna('').tolist()
-full_image_flags = df['Full image'].fillna('').astype(str).str.strip().str.lower().tolist()
-# Extract logos column and fill missing values with an empty string
-
-# Ensure the lists are of the same length
-min_length = min(len(urls), len(prices), len(delivery_times), len(sizes), len(genders), len(types), len(dates), len(logos))
-urls = urls[:min_length]
-prices = prices[:min_length]
-delivery_times = delivery_times[:min_length]
-sizes = sizes[:min_length]
-genders = genders[:min_length]
-types = types[:min_length]
-dates = dates[:min_length]
-logos = logos[:min_length]
-custom_texts = custom_texts[:min_length]
-
-# Create directories if they don't exist
-for dir_path in [downloaded_dir, no_background_dir, final_dir]:
-    os.makedirs(dir_path, exist_ok=True)
-
-# Clear directories before processing
-if not args.skip_download and not args.imagenes_cuadradas:
-    clear_directory(downloaded_dir)
-    clear_directory(no_background_dir)
-clear_directory(final_dir)
-
-# Paths for saving images
-input_paths = [os.path.join(downloaded_dir, f"image_{i}.png") for i in range(len(urls))]
-output_paths = [os.path.join(no_background_dir, f"image_no_bg_{i}.png") for i in range(len(urls))]
-
-# Path for error log
-error_log_path = os.path.join(base_dir, 'error_log.txt')
-if not args.skip_download:
-    # Clear the error log file
-    with open(error_log_path, "w") as log_file:
-        log_file.write("")
+parser.add_argument('--download-workers', type=int, default=download_workers, help='Number of concurrent downloads')
+parser.add_argument('--no-cache', action='store_true', help='Ignore the download and background-removal caches')
+parser.add_argument('--rembg-model', default=rembg_model, help='rembg model used to remove backgrounds (u2net, isnet-general-use, silueta, ...)')
+parser.add_argument('--rembg-batch-size', type=int, default=rembg_batch_size, help='Images per background-removal batch')
+parser.add_argument('--pipeline', action='store_true', help='Remove backgrounds in worker processes while downloads are still running')
+parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Background-removal worker processes for --pipeline (default: number of cores)')
+parser.add_argument('--jobs', type=int, default=1, help='Render images in N parallel processes')
+parser.add_argument('--rebuild', action='store_true', help='Re-render every final image, even if its inputs did not change')
+parser.add_argument('--report', default=run_report_path, help='Base path for the per-run timing report (.json and .csv)')
+parser.add_argument('--profile', action='store_true', help='Profile the render phase with cProfile (forces --jobs 1)')
+parser.add_argument('--format', type=parse_formats, default=output_formats, help='Output format(s) for the final images: png, webp, jpeg or a comma-separated list (default: png)')
+parser.add_argument('--compress-level', type=int, choices=range(10), default=output_png_compress_level, metavar='0-9', help='PNG compression level (lower is faster, larger files)')
+parser.add_argument('--quality', type=int, default=output_quality, help='WebP/JPEG quality (1-100)')
+parser.add_argument('--quantize', action='store_true', help='Save PNGs with a palette when it is lossless (256 colors or fewer)')
+parser.add_argument('--background-writes', action='store_true', help='Encode images in background threads while the next one is composed (only with --jobs 1)')
+parser.add_argument('--dedup-similar', action='store_true', help='Also treat near-identical photos (perceptual hash) as the same photo')
+parser.add_argument('--memory-budget', type=int, default=handoff_budget_bytes // (1024 * 1024), metavar='MB', help='Decoded images handed between stages in memory before falling back to the PNGs on disk (0 disables)')
+parser.add_argument('--preview', action='store_true', help='Render quick low-resolution JPEGs into images/preview with a contact sheet, without touching images/final')
+parser.add_argument('--preview-scale', type=float, default=preview_scale, help='Scale factor for --preview (0-1, default: 0.5)')
+parser.add_argument('--resume', action='store_true', help='Continue an interrupted run: keep finished downloads and images, retry only unfinished or failed rows')
+parser.add_argument('--watch', action='store_true', help='Keep running and re-render whenever the spreadsheet, templates/ or fonts/ change')
+
+SHEET_PATH = 'Promos Fotos Datos.xlsx'
+ERROR_LOG_PATH = os.path.join(base_dir, 'error_log.txt')
+# Lo que vigila --watch (templates/ incluye los logos)
+WATCHED_PATHS = [SHEET_PATH, 'templates', 'fonts']
+
+def load_sheet(args):
+    # Load the Excel file (una fila tipada por producto, ver loader.py)
+    with timed('load_sheet', SHEET_PATH, os.path.getsize(SHEET_PATH)):
+        rows = load_rows(SHEET_PATH, downloaded_dir, no_background_dir, cache_dir=None if args.no_cache else sheet_cache_dir)
+    # Tallas mal escritas: se avisa antes de empezar y esos chips se omiten al dibujar
+    for index, size, problem in malformed_sizes(rows):
+        print(f"⚠️  Fila {index + 2}: talla '{size}' con {problem}; se omite en los chips.")
+        log_error(ERROR_LOG_PATH, f"Malformed size spec in row {index + 2} ('{size}'): {problem}\n")
+    return rows
+
+# Descarga las imágenes de las filas indicadas y les quita el fondo, anotando en el journal
+# cada fila a medida que termina
+def process_images(args, rows, journal):
+    from image_processing import remove_backgrounds, remove_backgrounds_parallel
 
-# Download and process images if flag is not set
-if not args.skip_download and not args.imagenes_cuadradas:
     print("Downloading and processing images...")
-    for i, url in enumerate(tqdm(urls, desc="\033[94mDownloading images\033[0m", unit="image", ncols=100, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [elapsed: {elapsed} left: {remaining}]')):
-        if download_image(url, input_paths[i], error_log_path):
-            if full_image_flags[i] == "si":
-                print(f"✅ Imagen {i} marcada como FULL IMAGE. No se elimina fondo.")
-                shutil.copy(input_paths[i], output_paths[i])
+    # Cada foto se descarga y se procesa una vez aunque la usen varias filas (ver dedup.py)
+    dedup = PhotoDedup(rows, similar=args.dedup_similar)
+    dedup.remove_stale_files()
+    unique_rows = dedup.unique_rows
+    urls = [row.url for row in unique_rows]
+    input_paths = [row.input_path for row in unique_rows]
+    download_cache = None if args.no_cache else DownloadCache(download_cache_dir, ttl=download_cache_ttl, variant=f"max{download_max_dimension}")
+    result_cache = None if args.no_cache else ResultCache(result_cache_dir, result_cache_max_bytes)
+    downloads = download_images(urls, input_paths, ERROR_LOG_PATH, max_workers=args.download_workers, cache=download_cache)
+    download_bar = tqdm(total=len(urls), desc="\033[94mDownloading images\033[0m", unit="image", ncols=100, position=0, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [elapsed: {elapsed} left: {remaining}]')
+    processing_bar = tqdm(total=len(urls), desc="\033[95mRemoving backgrounds\033[0m", unit="image", ncols=100, position=1, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [elapsed: {elapsed} left: {remaining}]')
+
+    def background_jobs():
+        for i, downloaded in downloads:
+            download_bar.update(1)
+            for row in dedup.url_groups[urls[i]]:
+                journal.mark(row, 'download', downloaded)
+            # Fotos de esta descarga que todavía no se procesaron (ninguna si el contenido ya se vio)
+            leaders = dedup.add_download(unique_rows[i]) if downloaded else []
+            if len(leaders) != 1:
+                processing_bar.total += len(leaders) - 1
+                processing_bar.refresh()
+            for row in leaders:
+                if row.full_image:
+                    tqdm.write(f"✅ Imagen {row.index} marcada como FULL IMAGE. No se elimina fondo.")
+                    copy_atomic(row.input_path, row.output_path)
+                    journal.mark(row, 'no_background', True)
+                    processing_bar.update(1)
+                else:
+                    yield row.input_path, row.output_path
+            journal.flush()
+
+    # El resultado se escribe con temporal + rename: si existe, la fila terminó bien
+    rows_by_output = {row.output_path: row for row in rows}
+    def background_done(input_path, output_path):
+        journal.mark(rows_by_output[output_path], 'no_background', os.path.exists(output_path))
+        journal.flush()
+
+    if args.pipeline:
+        remove_backgrounds_parallel(background_jobs(), ERROR_LOG_PATH, cache=result_cache, model_name=args.rembg_model, workers=args.workers, progress=processing_bar, on_done=background_done)
+    else:
+        remove_backgrounds(background_jobs(), ERROR_LOG_PATH, cache=result_cache, model_name=args.rembg_model, batch_size=args.rembg_batch_size, progress=processing_bar, on_done=background_done)
+    download_bar.close()
+    processing_bar.close()
+    with timed('dedup.share'):
+        dedup.share_results()
+    for row in rows:
+        journal.mark(row, 'no_background', os.path.exists(row.output_path))
+    journal.flush(force=True)
+    print(dedup.summary())
+
+def output_options_from(args):
+    background_writes = args.background_writes and (args.jobs <= 1 or args.profile)
+    if args.background_writes and not background_writes:
+        print("--background-writes only applies with --jobs 1; writing in the worker processes instead.")
+    return OutputOptions(args.format, args.compress_level, args.quantize, args.quality, background_writes)
+
+# Fuentes, plantillas y logos se decodifican una vez (y en cada proceso del pool)
+def warm_up_args(args, rows):
+    if args.imagenes_cuadradas:
+        return font_path, [], [], square_template_path, [row.logo for row in rows]
+    card_paths = sorted({theme.card_path for theme in THEMES.values()})
+    template_paths = sorted({theme.template_for(with_price) for theme in THEMES.values() for with_price in (True, False)})
+    return font_path, card_paths, template_paths, None, [row.logo for row in rows]
+
+# --preview: todas las imágenes a escala reducida, con remuestreo barato y en JPEG, en
+# images/preview (sin tocar images/final ni el manifiesto) y una hoja de contactos para
+# revisarlas juntas. Devuelve cuántas se generaron
+def render_preview(args, rows):
+    output_options = OutputOptions(('jpeg',), quality=preview_quality, scale=args.preview_scale)
+    set_resample(Image.BILINEAR)
+    os.makedirs(preview_dir, exist_ok=True)
+    clear_directory(preview_dir)
+    if args.imagenes_cuadradas:
+        tasks = [RenderTask(f"square preview {row.index + 1}", create_square_image, row, preview_dir, font_path, square_template_path, output_options)
+                 for row in rows]
+    else:
+        tasks = [RenderTask(f"final previews {i // 3 + 1}", create_final_images, rows[i:i + 3], preview_dir, font_path, variants=VARIANTS, output_options=output_options)
+                 for i in range(0, len(rows), 3)]
+    warm_args = warm_up_args(args, rows)
+    warm_up(*warm_args)
+    run_render_tasks(tasks, jobs=args.jobs, desc="Rendering previews", error_log_path=ERROR_LOG_PATH, initializer=warm_up, initargs=warm_args)
+    clear_handoff()
+
+    paths = []
+    for dir_path, _, filenames in os.walk(preview_dir):
+        paths.extend(os.path.join(dir_path, name) for name in filenames if name.endswith('.jpg'))
+    paths.sort(key=lambda path: (os.path.dirname(path), len(path), path))
+    html_path, image_path = write_contact_sheet(paths, preview_dir, f"Preview: {len(rows)} row(s), {len(paths)} image(s)")
+    print(f"Contact sheet: {html_path}" + (f" and {image_path}" if image_path else ""))
+    return len(paths)
+
+# Genera las imágenes finales (o cuadradas) cuyas entradas cambiaron según el manifiesto.
+# Devuelve cuántas se renderizaron
+def render_outputs(args, rows, build_manifest, output_options, journal):
+    # Cada tarea guarda sus salidas como {ruta: huella de sus entradas}
+    tasks = []
+    if args.imagenes_cuadradas:
+        print("Creating square images...")
+        for row in rows:
+            task = RenderTask(f"square image {row.index + 1}", create_square_image, row, final_dir, font_path, square_template_path, output_options)
+            square_fingerprint = square_image_fingerprint(row, font_path, square_template_path, output_options)
+            task.outputs = {path: square_fingerprint for path in format_paths(square_image_path(final_dir, row.index), output_options.formats)}
+            task.rows = [row]
+            tasks.append(task)
+    else:
+        print("Creating final images...")
+        # Una tarea por lote de 3 filas: el diseño se calcula una vez y se rasteriza por variante
+        for i in range(0, len(rows), 3):
+            batch = rows[i:i + 3]
+            task = RenderTask(f"final images {i // 3 + 1}", create_final_images, batch, final_dir, font_path, variants=VARIANTS, output_options=output_options)
+            task.variant_outputs = {}
+            for theme_name, with_price in VARIANTS:
+                variant_fingerprint = final_image_fingerprint(batch, font_path, theme_name, with_price, output_options)
+                paths = format_paths(final_image_path(final_dir, theme_name, with_price, i), output_options.formats)
+                task.variant_outputs[(theme_name, with_price)] = {path: variant_fingerprint for path in paths}
+            task.outputs = {path: fp for outputs in task.variant_outputs.values() for path, fp in outputs.items()}
+            task.rows = batch
+            tasks.append(task)
+
+    # Borrar salidas de filas eliminadas y quedarse solo con las tareas desactualizadas
+    scope_dirs = [os.path.join(final_dir, "cuadradas")] if args.imagenes_cuadradas else [os.path.join(final_dir, theme_name) for theme_name in THEMES]
+    removed = build_manifest.prune({path for task in tasks for path in task.outputs}, scope_dirs)
+    if removed:
+        print(f"Removed {len(removed)} outdated image(s).")
+    total_outputs = sum(len(task.outputs) for task in tasks)
+    stale_tasks = []
+    for task in tasks:
+        if hasattr(task, 'variant_outputs'):
+            # Solo las variantes del lote cuyas entradas cambiaron
+            stale_variants = [variant for variant, outputs in task.variant_outputs.items()
+                              if any(build_manifest.is_stale(path, fp) for path, fp in outputs.items())]
+            task.kwargs['variants'] = stale_variants
+            task.outputs = {path: fp for variant in stale_variants for path, fp in task.variant_outputs[variant].items()}
+        if any(build_manifest.is_stale(path, fp) for path, fp in task.outputs.items()):
+            stale_tasks.append(task)
+    print(f"{sum(len(task.outputs) for task in stale_tasks)} of {total_outputs} image(s) need rendering.")
+
+    warm_args = warm_up_args(args, rows)
+    warm_up(*warm_args)
+    # Cada imagen sin fondo se decodifica y redimensiona una vez para todas sus variantes
+    stale_images = sorted({row.output_path for task in stale_tasks for row in task.rows})
+    with timed('prepare_images', None, len(stale_images)):
+        prepare_images(stale_images, ['square'] if args.imagenes_cuadradas else ['final'])
+    # Las variantes preparadas ya están en memoria: las imágenes completas sobran
+    clear_handoff()
+    if args.profile:
+        if args.jobs > 1:
+            print("--profile renders in this process; ignoring --jobs.")
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    # Cada imagen terminada se registra enseguida en el manifiesto y el journal: si el proceso
+    # muere, la siguiente ejecución no la repite
+    def task_done(task, error):
+        for path, output_fingerprint in task.outputs.items():
+            ok = error is None and os.path.exists(path)
+            if ok:
+                build_manifest.record(path, output_fingerprint)
+            if ok or error is not None:
+                for row in task.rows:
+                    journal.mark(row, f"render:{path}", ok)
+        if journal.flush():
+            build_manifest.save()
+
+    errors = run_render_tasks(stale_tasks, jobs=1 if args.profile else args.jobs, desc="Processing square images" if args.imagenes_cuadradas else "Processing final images", error_log_path=ERROR_LOG_PATH, initializer=warm_up, initargs=warm_args, on_done=task_done)
+    # Las imágenes codificadas en segundo plano tienen que estar en disco antes de registrarlas
+    write_errors = wait_for_writes()
+    report_errors(write_errors, ERROR_LOG_PATH)
+    if args.profile:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        import pstats
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+        print(f"Render profile saved to {profile_path} (open with: python -m pstats {profile_path})")
+
+    failed = {label for label, _ in errors + write_errors}
+    for task in stale_tasks:
+        for path, output_fingerprint in task.outputs.items():
+            ok = task.label not in failed and path not in failed and os.path.exists(path)
+            if ok:
+                build_manifest.record(path, output_fingerprint)
             else:
-                remove_background(input_paths[i], output_paths[i], error_log_path)
-      
-                    
-if args.imagenes_cuadradas:
-    print("Creating square images...")
-    for i in tqdm(range(len(urls)), desc="\033[92mProcessing square images\033[0m", unit="image", ncols=100):
-        create_square_image(i, urls, prices, delivery_times, sizes, genders, types, dates, logos, input_paths, output_paths, final_dir, font_path, square_template_path, custom_texts)
-else:
-    print("Creating final images...")
-    for mode in ['light', 'dark']:
-        if mode == 'light':
-            card_paths = {
-                'with_prices': 'templates/light_card.png',
-                'without_prices': 'templates/light_card.png'
-            }
-            template_paths = {
-                'with_prices': 'templates/light_template.png',
-                'without_prices': 'templates/without_price_light_template.png'
-            }
+                build_manifest.forget(path)
+            for row in task.rows:
+                journal.mark(row, f"render:{path}", ok)
+    build_manifest.save()
+    journal.flush(force=True)
+    return sum(len(task.outputs) for task in stale_tasks)
+
+def open_output_folder(args):
+    import webbrowser
+    # Open the final directory in the file explorer
+    if args.preview:
+        webbrowser.open('file://' + os.path.realpath(os.path.join(preview_dir, "contact_sheet.html")))
+    elif args.imagenes_cuadradas:
+        webbrowser.open('file://' + os.path.realpath(os.path.join(final_dir, "cuadradas")))
+    else:
+        webbrowser.open('file://' + os.path.realpath(final_dir))
+
+def finish_report(args, started_at, run_start):
+    stages = write_report(args.report, started_at, time.perf_counter() - run_start)
+    print_summary(stages)
+    print_output_summary(stages)
+    print(f"Run report saved to {args.report}.json and {args.report}.csv")
+
+# Filas que hay que volver a descargar: nuevas, con otro link u otra marca de "Full image"
+# en su posición, o cuya imagen sin fondo falta
+def rows_to_fetch(previous_rows, rows):
+    changed = []
+    for row in rows:
+        previous = previous_rows[row.index] if row.index < len(previous_rows) else None
+        if previous is None or (previous.url, previous.full_image) != (row.url, row.full_image) or not os.path.exists(row.output_path):
+            changed.append(row)
+    return changed
+
+# --watch: el proceso sigue vivo con la sesión de rembg, fuentes, plantillas y logos en
+# memoria, y en cada cambio solo descarga las filas nuevas o cambiadas y renderiza lo afectado
+def watch(args, rows, build_manifest, output_options, journal):
+    state = snapshot(WATCHED_PATHS)
+    print(f"Watching {', '.join(WATCHED_PATHS)} for changes (Ctrl+C to stop)...")
+    try:
+        while True:
+            changed, state = wait_for_change(WATCHED_PATHS, state, watch_interval)
+            started_at = datetime.now()
+            run_start = time.perf_counter()
+            print(f"\nChanged: {', '.join(changed[:5])}{' ...' if len(changed) > 5 else ''}")
+            if any(path != SHEET_PATH for path in changed):
+                # Las cachés de recursos van por ruta: una plantilla o fuente editada se recarga
+                clear_assets()
+                clear_sprites()
+                clear_typeset()
+            try:
+                previous_rows, rows = rows, load_sheet(args)
+                if not args.skip_download and not args.imagenes_cuadradas:
+                    fetch = rows_to_fetch(previous_rows, rows)
+                    if fetch:
+                        process_images(args, fetch, journal)
+                if args.preview:
+                    rendered = render_preview(args, rows)
+                else:
+                    rendered = render_outputs(args, rows, build_manifest, output_options, journal)
+            except Exception:
+                # p. ej. la planilla a medio guardar: se informa y se sigue vigilando
+                print(traceback.format_exc())
+                continue
+            print(f"Updated {rendered} image(s) in {time.perf_counter() - run_start:.2f} s.")
+            finish_report(args, started_at, run_start)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+def main():
+    args = parser.parse_args()
+    if not 0 < args.preview_scale <= 1:
+        parser.error("--preview-scale must be between 0 and 1")
+    started_at = datetime.now()
+    run_start = time.perf_counter()
+    record('startup.imports', IMPORT_SECONDS)
+
+    # Create directories if they don't exist
+    for dir_path in [downloaded_dir, no_background_dir, final_dir]:
+        os.makedirs(dir_path, exist_ok=True)
+
+    # Con --resume se sigue el journal de la ejecución anterior (ver journal.py)
+    journal = RunJournal(run_journal_path, args.rembg_model, resume=args.resume)
+    if args.resume and not journal.resumed:
+        print("No journal from a previous run with this rembg model; processing every row.")
+
+    # Clear the error log file
+    if not args.skip_download and not args.resume:
+        with open(ERROR_LOG_PATH, "w") as log_file:
+            log_file.write("")
+
+    rows = load_sheet(args)
+
+    # Clear directories before processing
+    if not args.skip_download and not args.imagenes_cuadradas and not args.resume:
+        clear_directory(downloaded_dir)
+        clear_directory(no_background_dir)
+    # Las imágenes finales se regeneran solo si cambiaron sus entradas (ver manifest.py)
+    build_manifest = BuildManifest(build_manifest_path)
+    if args.rebuild:
+        clear_directory(final_dir)
+        build_manifest.entries = {}
+
+    output_options = output_options_from(args)
+    # Con --pipeline rembg corre en otros procesos y no hay nada que entregar en memoria
+    set_budget(0 if args.pipeline else args.memory_budget * 1024 * 1024)
+    try:
+        # Download and process images if flag is not set
+        if not args.skip_download and not args.imagenes_cuadradas:
+            fetch = journal.pending(rows) if args.resume else rows
+            if args.resume:
+                print(f"Resuming: {len(rows) - len(fetch)} of {len(rows)} row(s) already downloaded and processed.")
+            if fetch:
+                process_images(args, fetch, journal)
+
+        if args.preview:
+            render_preview(args, rows)
         else:
-            card_paths = {
-                'with_prices': 'templates/dark_card.png',
-                'without_prices': 'templates/dark_card.png'
-            }
-            template_paths = {
-                'with_prices': 'templates/dark_template.png',
-                'without_prices': 'templates/without_price_dark_template.png'
-            }
-        
-        for with_price_key, with_price_flag in [('with_prices', True), ('without_prices', False)]:
-            current_card_path = card_paths[with_price_key]
-            current_template_path = template_paths[with_price_key]
-
-            for i in tqdm(range(0, len(urls), 3), desc=f"\033[92mProcessing {mode} images ({with_price_key})\033[0m", unit="batch", ncols=100, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [elapsed: {elapsed} left: {remaining}]'):
-                create_final_image(i, urls, prices, delivery_times, sizes, genders, types, dates, logos, input_paths, output_paths, final_dir, font_path, current_card_path, current_template_path, mode, with_price=with_price_flag)
-
-# Open the final directory in the file explorer
-if args.imagenes_cuadradas:
-    webbrowser.open('file://' + os.path.realpath(os.path.join(final_dir, "cuadradas")))
-else:
-    webbrowser.open('file://' + os.path.realpath(final_dir))
-
-print(f"All images processed and saved. You can view them in the following directory: {final_dir}")
+            render_outputs(args, rows, build_manifest, output_options, journal)
+    except KeyboardInterrupt:
+        journal.flush(force=True)
+        build_manifest.save()
+        print("\nInterrupted. Run again with --resume to continue where this run stopped.")
+        raise SystemExit(130)
+    journal.flush(force=True, finished=True)
+    failures = journal.failures(rows)
+    if failures:
+        print(f"⚠️  {len(failures)} row(s) failed (see {ERROR_LOG_PATH}); run again with --resume to retry only those.")
+
+    open_output_folder(args)
+    finish_report(args, started_at, run_start)
+    print(f"All images processed and saved. You can view them in the following directory: {preview_dir if args.preview else final_dir}")
+
+    if args.watch:
+        watch(args, rows, build_manifest, output_options, journal)
+
+
+if __name__ == '__main__':
+    main()
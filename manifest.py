@@ -0,0 +1,60 @@
+import os
+import json
+import hashlib
+
+from cache import sha256_file, read_json, write_json_atomic
+
+_file_digests = {}
+
+# Hash de un archivo memoizado por (ruta, mtime, tamaño); None si no existe
+def file_digest(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _file_digests:
+        _file_digests[key] = sha256_file(path)
+    return _file_digests[key]
+
+def fingerprint(*parts):
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class BuildManifest:
+    # Guarda la huella de las entradas con que se generó cada imagen final,
+    # para volver a renderizar solo las que cambiaron
+    def __init__(self, path):
+        self.path = path
+        self.entries = read_json(path, {})
+
+    def is_stale(self, output_path, output_fingerprint):
+        return self.entries.get(output_path) != output_fingerprint or not os.path.exists(output_path)
+
+    def record(self, output_path, output_fingerprint):
+        self.entries[output_path] = output_fingerprint
+
+    def forget(self, output_path):
+        self.entries.pop(output_path, None)
+
+    # Borra las salidas que ya no corresponden a ninguna fila (p. ej. filas eliminadas)
+    # dentro de los directorios indicados, estén o no registradas en el manifiesto
+    def prune(self, expected_outputs, scope_dirs):
+        scope_dirs = [os.path.join(scope_dir, "") for scope_dir in scope_dirs]
+        removed = []
+        for scope_dir in scope_dirs:
+            for root, _, filenames in os.walk(scope_dir):
+                for filename in filenames:
+                    output_path = os.path.join(root, filename)
+                    if output_path not in expected_outputs:
+                        os.unlink(output_path)
+                        removed.append(output_path)
+        for output_path in list(self.entries):
+            if output_path not in expected_outputs and any(output_path.startswith(d) for d in scope_dirs):
+                self.forget(output_path)
+        return removed
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_json_atomic(self.path, self.entries)
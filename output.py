@@ -0,0 +1,145 @@
+import os
+import time
+import argparse
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Tuple
+from PIL import Image
+
+from instrumentation import record, timed, file_size
+from constants import output_formats, output_png_compress_level, output_quality, output_writer_threads, output_max_pending
+
+# Formato -> extensión del archivo
+FORMATS = {'png': 'png', 'webp': 'webp', 'jpeg': 'jpg'}
+ALIASES = {'jpg': 'jpeg'}
+
+
+class OutputOptions(NamedTuple):
+    formats: Tuple[str, ...] = output_formats
+    compress_level: int = output_png_compress_level
+    quantize: bool = False  # PNG con paleta cuando la imagen tiene <= 256 colores y no se pierde nada
+    quality: int = output_quality
+    background: bool = False  # codificar en hilos mientras se compone la siguiente imagen
+    scale: float = 1.0  # --preview: se reduce justo antes de codificar
+
+
+DEFAULT_OUTPUT = OutputOptions()
+
+# Tipo para argparse: "png", "webp,png", "jpg"...
+def parse_formats(value):
+    formats = []
+    for name in value.lower().split(','):
+        name = ALIASES.get(name.strip(), name.strip())
+        if name not in FORMATS:
+            raise argparse.ArgumentTypeError(f"unknown format '{name}' (choose from {', '.join(FORMATS)})")
+        if name not in formats:
+            formats.append(name)
+    return tuple(formats)
+
+# Rutas de salida de una imagen, una por formato; la primera es la principal
+def format_paths(path, formats):
+    base = os.path.splitext(path)[0]
+    return [f"{base}.{FORMATS[fmt]}" for fmt in formats]
+
+def _quantize_lossless(image):
+    colors = image.getcolors(256)
+    if colors is None:
+        return image
+    method = Image.Quantize.FASTOCTREE if image.mode == 'RGBA' else Image.Quantize.MEDIANCUT
+    paletted = image.quantize(colors=len(colors), method=method)
+    if paletted.convert(image.mode).tobytes() != image.tobytes():
+        return image
+    return paletted
+
+def _flatten(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, image).convert('RGB')
+    return image.convert('RGB')
+
+# Reducción barata para las vistas previas: reduce() (promedio por bloques) si el factor es
+# entero, si no BILINEAR
+def _scaled(image, scale):
+    factor = 1 / scale
+    if abs(factor - round(factor)) < 1e-6:
+        return image.reduce(round(factor))
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.BILINEAR)
+
+def _encode(image, path, fmt, options):
+    start = time.perf_counter()
+    tmp_path = f"{path}.tmp"
+    try:
+        if fmt == 'png':
+            if options.quantize:
+                image = _quantize_lossless(image)
+            image.save(tmp_path, 'PNG', compress_level=options.compress_level)
+        elif fmt == 'webp':
+            image.save(tmp_path, 'WEBP', quality=options.quality, method=4)
+        else:
+            _flatten(image).save(tmp_path, 'JPEG', quality=options.quality)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    record(f"encode.{fmt}", time.perf_counter() - start, path, file_size(path))
+
+
+_writer = None
+_writer_lock = threading.Lock()
+_pending = []
+_slots = threading.BoundedSemaphore(output_max_pending)
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=output_writer_threads, thread_name_prefix="output")
+        return _writer
+
+def _encode_and_release(image, path, fmt, options):
+    try:
+        _encode(image, path, fmt, options)
+    finally:
+        _slots.release()
+
+# Guarda la imagen en cada formato pedido. En segundo plano, como mucho output_max_pending
+# imágenes esperan a codificarse; hay que llamar a wait_for_writes() antes de usar los archivos
+def save_image(image, path, options=DEFAULT_OUTPUT):
+    paths = format_paths(path, options.formats)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if options.scale != 1:
+        with timed('encode.scale', path):
+            image = _scaled(image, options.scale)
+    for fmt, fmt_path in zip(options.formats, paths):
+        if options.background:
+            _slots.acquire()
+            future = _get_writer().submit(_encode_and_release, image, fmt_path, fmt, options)
+            with _writer_lock:
+                _pending.append((fmt_path, future))
+        else:
+            _encode(image, fmt_path, fmt, options)
+    return paths
+
+# Espera las escrituras pendientes y devuelve los errores como [(ruta, traceback)]
+def wait_for_writes():
+    with _writer_lock:
+        pending = list(_pending)
+        _pending.clear()
+    errors = []
+    for path, future in pending:
+        try:
+            future.result()
+        except Exception:
+            errors.append((path, traceback.format_exc()))
+    return errors
+
+# Tamaño total y tiempo de codificación por formato, a partir del resumen de instrumentation
+def print_output_summary(stages):
+    for fmt in FORMATS:
+        entry = stages.get(f"encode.{fmt}")
+        if entry:
+            print(f"{fmt.upper()}: {entry['count']} file(s), {entry['bytes'] / (1024 * 1024):.1f} MB, "
+                  f"{entry['mean_ms']} ms mean encode ({entry['total_s']} s total)")
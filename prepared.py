@@ -0,0 +1,64 @@
+import os
+from functools import lru_cache
+from PIL import Image
+
+from instrumentation import timed
+from handoff import get as get_handoff
+from constants import prepared_cache_size
+
+# Etapa de imágenes preparadas: cada imagen sin fondo se decodifica una vez y se reduce
+# directamente al tamaño que necesita cada diseño. Las variantes quedan en memoria y las
+# comparten los renders claro/oscuro, con/sin precio. Si se preparan en el proceso principal
+# antes de crear el pool, los procesos hijos las heredan al hacer fork.
+# Las imágenes devueltas son compartidas: no dibujar sobre ellas.
+
+def _final_size(width, height):
+    # 430 px de ancho; si así pasa de 340 px de alto, 340 px de alto
+    ratio = width / height
+    new_width, new_height = 430, int(430 / ratio)
+    if new_height > 340:
+        new_width, new_height = int(340 * ratio), 340
+    return new_width, new_height
+
+def _square_size(width, height):
+    # Lo más grande que quepa en 500 x 315 px (del y=100 del producto al y=415 de los recuadros)
+    scale = min(500 / width, 315 / height)
+    return int(width * scale), int(height * scale)
+
+LAYOUTS = {
+    'final': _final_size,
+    'square': _square_size,
+}
+
+# LANCZOS para la exportación; --preview usa uno más barato (set_resample)
+_resample = Image.LANCZOS
+
+@lru_cache(maxsize=prepared_cache_size)
+def _prepare(path, layout, mtime_ns, resample):
+    with timed(f"prepare.{layout}", path):
+        image = get_handoff(path)
+        if image is None:
+            image = Image.open(path)
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        return image.resize(LAYOUTS[layout](image.width, image.height), resample)
+
+# Variante RGBA de la imagen para el diseño indicado. Lanza FileNotFoundError si no existe
+def get_prepared(path, layout):
+    return _prepare(path, layout, os.stat(path).st_mtime_ns, _resample)
+
+def set_resample(resample):
+    global _resample
+    _resample = resample
+
+# Prepara por adelantado las variantes de las imágenes que se van a renderizar
+def prepare_images(paths, layouts):
+    for path in paths:
+        for layout in layouts:
+            try:
+                get_prepared(path, layout)
+            except OSError:
+                pass  # el render la informa como faltante o dañada
+
+def clear_prepared():
+    _prepare.cache_clear()
@@ -0,0 +1,81 @@
+import os
+import html
+from datetime import datetime
+from PIL import Image, ImageDraw
+
+from instrumentation import timed
+from constants import contact_sheet_columns, contact_sheet_tile_width, preview_quality
+
+# Hoja de contactos de --preview: todas las imágenes de la vista previa en una página HTML
+# (con rutas relativas, se abre directo desde el disco) y en una sola imagen JPEG
+
+CAPTION_HEIGHT = 16
+GAP = 8
+# Límite de alto de JPEG: con muchas imágenes se achican las miniaturas
+MAX_SHEET_HEIGHT = 60000
+
+def _html(paths, preview_dir, title):
+    figures = []
+    for path in paths:
+        relative = os.path.relpath(path, preview_dir).replace(os.sep, '/')
+        figures.append(f'<figure><a href="{html.escape(relative)}"><img src="{html.escape(relative)}" loading="lazy"></a>'
+                       f'<figcaption>{html.escape(relative)}</figcaption></figure>')
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>
+<style>
+body {{ font-family: sans-serif; margin: 16px; background: #f4f4f4; }}
+main {{ display: grid; grid-template-columns: repeat(auto-fill, minmax({contact_sheet_tile_width}px, 1fr)); gap: {GAP}px; }}
+figure {{ margin: 0; background: white; padding: 4px; }}
+img {{ width: 100%; display: block; }}
+figcaption {{ font-size: 11px; color: #555; word-break: break-all; }}
+</style></head>
+<body><h1>{html.escape(title)}</h1>
+<p>{len(paths)} image(s), generated {datetime.now():%Y-%m-%d %H:%M:%S}</p>
+<main>
+{chr(10).join(figures)}
+</main></body></html>
+"""
+
+def _tiles(paths, tile_width):
+    tiles = []
+    for path in paths:
+        with Image.open(path) as image:
+            image.draft("RGB", (tile_width, tile_width * 4))
+            height = max(1, round(image.height * tile_width / image.width))
+            tiles.append(image.convert("RGB").resize((tile_width, height), Image.BILINEAR))
+    return tiles
+
+def _sheet_image(paths, preview_dir, columns):
+    tile_width = contact_sheet_tile_width
+    rows = [paths[i:i + columns] for i in range(0, len(paths), columns)]
+    # Alto estimado con la proporción de la primera imagen
+    with Image.open(paths[0]) as first:
+        aspect = first.height / first.width
+    while len(rows) * (tile_width * aspect + CAPTION_HEIGHT + GAP) > MAX_SHEET_HEIGHT and tile_width > 40:
+        tile_width = int(tile_width * 0.8)
+
+    tiles = _tiles(paths, tile_width)
+    row_heights = [max(tile.height for tile in tiles[i:i + columns]) + CAPTION_HEIGHT + GAP for i in range(0, len(tiles), columns)]
+    sheet = Image.new("RGB", (GAP + columns * (tile_width + GAP), GAP + sum(row_heights)), "white")
+    draw = ImageDraw.Draw(sheet)
+    y = GAP
+    for r, row_height in enumerate(row_heights):
+        for c, (path, tile) in enumerate(zip(paths[r * columns:(r + 1) * columns], tiles[r * columns:(r + 1) * columns])):
+            x = GAP + c * (tile_width + GAP)
+            sheet.paste(tile, (x, y))
+            draw.text((x, y + tile.height + 2), os.path.relpath(path, preview_dir), fill="#555555")
+        y += row_height
+    return sheet
+
+# Escribe contact_sheet.html y contact_sheet.jpg en preview_dir. Devuelve sus rutas (la
+# imagen es None si no hay nada que mostrar)
+def write_contact_sheet(paths, preview_dir, title, columns=contact_sheet_columns):
+    html_path = os.path.join(preview_dir, "contact_sheet.html")
+    image_path = os.path.join(preview_dir, "contact_sheet.jpg")
+    with timed('preview.contact_sheet', html_path):
+        with open(html_path, "w", encoding="utf-8") as file:
+            file.write(_html(paths, preview_dir, title))
+        if not paths:
+            return html_path, None
+        _sheet_image(paths, preview_dir, columns).save(image_path, "JPEG", quality=preview_quality)
+    return html_path, image_path
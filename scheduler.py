@@ -0,0 +1,75 @@
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+
+from utils import log_error
+from instrumentation import drain, merge
+
+BAR_FORMAT = '{l_bar}{bar}| {n_fmt}/{total_fmt} [elapsed: {elapsed} left: {remaining}]'
+
+class RenderTask:
+    # Una llamada independiente a create_final_image / create_square_image
+    def __init__(self, label, func, *args, **kwargs):
+        self.label = label
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self):
+        return self.func(*self.args, **self.kwargs)
+
+def _run(task):
+    try:
+        task()
+        return None
+    except Exception:
+        return traceback.format_exc()
+
+# En los procesos del pool también se devuelven las mediciones tomadas durante la tarea
+def _run_in_worker(task):
+    drain()  # descarta lo heredado del proceso padre al hacer fork
+    return _run(task), drain()
+
+# Ejecuta las tareas en serie (jobs=1) o en un pool de procesos. Los nombres de salida los
+# fija cada tarea, así que el orden de ejecución no cambia el resultado. Devuelve los
+# errores como [(label, traceback)] en vez de cortar el render en la primera falla.
+# on_done(task, error) se llama en este proceso a medida que termina cada tarea
+def run_render_tasks(tasks, jobs=1, desc="Rendering", error_log_path=None, initializer=None, initargs=(), on_done=None):
+    errors = []
+    progress = tqdm(total=len(tasks), desc=f"\033[92m{desc}\033[0m", unit="image", ncols=100, bar_format=BAR_FORMAT)
+    if jobs <= 1:
+        for task in tasks:
+            error = _run(task)
+            if error:
+                errors.append((task.label, error))
+            if on_done:
+                on_done(task, error)
+            progress.update(1)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs) as pool:
+            futures = {pool.submit(_run_in_worker, task): task for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    error, records = future.result()
+                    merge(records)
+                except Exception:
+                    error = traceback.format_exc()
+                if error:
+                    errors.append((futures[future].label, error))
+                if on_done:
+                    on_done(futures[future], error)
+                progress.update(1)
+    progress.close()
+    report_errors(errors, error_log_path)
+    return errors
+
+def report_errors(errors, error_log_path=None):
+    if not errors:
+        return
+    errors.sort()
+    print(f"❌ {len(errors)} render task(s) failed:")
+    for label, error in errors:
+        reason = error.strip().splitlines()[-1]
+        print(f"  - {label}: {reason}")
+        if error_log_path:
+            log_error(error_log_path, f"Failed to render {label}. Reason: {error}\n")
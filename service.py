@@ -0,0 +1,411 @@
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import argparse
+import mimetypes
+import threading
+import traceback
+from datetime import datetime
+from functools import partial
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+from utils import clear_directory, download_images, log_error
+from loader import load_rows, record_from_json, rows_from_records
+from sizes import malformed_sizes
+from dedup import PhotoDedup
+from cache import DownloadCache, ResultCache, copy_atomic
+from drawing import create_final_images, create_square_image, warm_up
+from scheduler import RenderTask
+from instrumentation import drain, summarize
+from handoff import clear_handoff
+from themes import THEMES, VARIANTS
+from output import OutputOptions, parse_formats
+from constants import font_path, square_template_path, download_workers, download_cache_dir, download_cache_ttl, download_max_dimension, result_cache_dir, result_cache_max_bytes, rembg_model, output_formats, output_png_compress_level, output_quality, service_jobs_dir, service_host, service_port, service_workers, service_max_queued, service_max_upload_bytes, service_max_rows, service_max_jobs, service_rembg_concurrency
+
+# Servicio HTTP local para generar promos desde otras herramientas sin correr main.py.
+# Uso: python service.py [--port 8700] [--workers 2]  (cliente de prueba: service_client.py)
+#
+#   POST /jobs               planilla .xlsx en el cuerpo (?square=1&format=webp,png) o JSON
+#                            {"rows": [...], "square": false, "format": "webp,png"} (o una
+#                            lista ["webp", "png"]); responde 202
+#   GET  /jobs/<id>          estado, avance, errores, tiempos por etapa (al terminar) y URLs
+#                            de las imágenes generadas
+#   GET  /jobs               todos los trabajos
+#   GET  /files/<id>/<ruta>  archivos del trabajo
+#   GET  /health
+#
+# Las filas JSON usan las claves de loader.record_from_json (url, price, delivery_time, size,
+# gender, type, date, logo, custom_text, full_image). Los trabajos esperan en una cola
+# acotada y los procesan service_workers hilos que comparten la sesión de rembg, fuentes,
+# plantillas, logos y las cachés de descargas y de fondos, cargados una vez al arrancar.
+
+parser = argparse.ArgumentParser(description='Serve promo image rendering over HTTP.')
+parser.add_argument('--host', default=service_host)
+parser.add_argument('--port', type=int, default=service_port)
+parser.add_argument('--workers', type=int, default=service_workers, help='Jobs processed at the same time')
+parser.add_argument('--max-queued', type=int, default=service_max_queued, help='Jobs waiting before new ones get 503')
+parser.add_argument('--rembg-model', default=rembg_model, help='rembg model used to remove backgrounds')
+parser.add_argument('--format', type=parse_formats, default=output_formats, help='Default output format(s): png, webp, jpeg or a comma-separated list')
+parser.add_argument('--compress-level', type=int, choices=range(10), default=output_png_compress_level, metavar='0-9', help='PNG compression level')
+parser.add_argument('--quality', type=int, default=output_quality, help='WebP/JPEG quality (1-100)')
+parser.add_argument('--no-cache', action='store_true', help='Do not use the download and background-removal caches')
+
+FINISHED = ('done', 'failed')
+
+
+class Job:
+    def __init__(self, job_dir, square, output_options, records=None, sheet_path=None):
+        self.id = os.path.basename(job_dir)
+        self.dir = job_dir
+        self.square = square
+        self.output_options = output_options
+        self.records = records
+        self.sheet_path = sheet_path
+        self.error_log_path = os.path.join(job_dir, 'error_log.txt')
+        self.final_dir = os.path.join(job_dir, 'final')
+        self.status = 'queued'
+        self.stage = None
+        self.rows = len(records) if records is not None else None
+        self.tasks_done = 0
+        self.tasks_total = 0
+        self.errors = []
+        self.outputs = []
+        self.timings = {}
+        self.submitted_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self, base_url):
+        seconds = None
+        if self.started_at:
+            seconds = round(((self.finished_at or datetime.now()) - self.started_at).total_seconds(), 2)
+        return {
+            'id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'square': self.square,
+            'formats': list(self.output_options.formats),
+            'rows': self.rows,
+            'progress': {'done': self.tasks_done, 'total': self.tasks_total},
+            'submitted_at': self.submitted_at.isoformat(timespec='seconds'),
+            'started_at': self.started_at and self.started_at.isoformat(timespec='seconds'),
+            'finished_at': self.finished_at and self.finished_at.isoformat(timespec='seconds'),
+            'seconds': seconds,
+            'errors': list(self.errors),
+            'timings': self.timings,
+            'outputs': [f"{base_url}/files/{self.id}/{quote(path)}" for path in self.outputs],
+            'error_log': f"{base_url}/files/{self.id}/error_log.txt" if os.path.exists(self.error_log_path) else None,
+        }
+
+
+class RenderService:
+    def __init__(self, jobs_dir, workers, max_queued, output_options, model_name=rembg_model, use_cache=True):
+        self.jobs_dir = jobs_dir
+        self.workers = workers
+        self.output_options = output_options
+        self.model_name = model_name
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=max_queued)
+        # rembg ya usa todos los núcleos en cada inferencia: dos trabajos a la vez solo se estorban
+        self.rembg_slots = threading.BoundedSemaphore(service_rembg_concurrency)
+        self.download_cache = DownloadCache(download_cache_dir, ttl=download_cache_ttl, variant=f"max{download_max_dimension}") if use_cache else None
+        self.result_cache = ResultCache(result_cache_dir, result_cache_max_bytes) if use_cache else None
+        # Los trabajos viven en memoria: los archivos de una ejecución anterior ya no tienen dueño
+        os.makedirs(jobs_dir, exist_ok=True)
+        clear_directory(jobs_dir)
+
+    # Carga una vez lo que comparten todos los trabajos y arranca los hilos
+    def start(self):
+        from image_processing import get_session
+        start = time.perf_counter()
+        card_paths = sorted({theme.card_path for theme in THEMES.values()})
+        template_paths = sorted({theme.template_for(with_price) for theme in THEMES.values() for with_price in (True, False)})
+        warm_up(font_path, card_paths, template_paths, square_template_path)
+        get_session(self.model_name)
+        print(f"Assets and rembg model '{self.model_name}' loaded in {time.perf_counter() - start:.1f} s.")
+        for n in range(self.workers):
+            threading.Thread(target=self._work, name=f"render-{n + 1}", daemon=True).start()
+
+    # Crea el trabajo a partir del cuerpo del POST. ValueError si la petición no sirve y
+    # queue.Full si ya hay service_max_queued trabajos esperando
+    def submit(self, body, content_type, query):
+        if content_type.startswith('application/json'):
+            try:
+                payload = json.loads(body)
+            except ValueError as e:
+                raise ValueError(f"invalid JSON: {e}")
+            if not isinstance(payload, dict) or not isinstance(payload.get('rows'), list) or not payload['rows']:
+                raise ValueError("expected {\"rows\": [...]} with at least one row")
+            records = []
+            for i, data in enumerate(payload['rows']):
+                try:
+                    records.append(record_from_json(data if isinstance(data, dict) else {}))
+                except ValueError as e:
+                    raise ValueError(f"row {i + 1}: {e}")
+            square, formats = bool(payload.get('square')), payload.get('format')
+            # "webp,png" o ["webp", "png"]
+            if isinstance(formats, list) and all(isinstance(fmt, str) for fmt in formats):
+                formats = ','.join(formats)
+            elif formats is not None and not isinstance(formats, str):
+                raise ValueError("format must be a string like 'webp,png'")
+        elif body.startswith(b'PK'):
+            records = None
+            square = query.get('square', [''])[0].lower() in ('1', 'true', 'si')
+            formats = query.get('format', [None])[0]
+        else:
+            raise ValueError("expected an .xlsx file or application/json")
+        if records is not None and len(records) > service_max_rows:
+            raise ValueError(f"{len(records)} rows; at most {service_max_rows} per job")
+        output_options = self.output_options
+        if formats:
+            try:
+                output_options = output_options._replace(formats=parse_formats(formats))
+            except argparse.ArgumentTypeError as e:
+                raise ValueError(str(e))
+
+        with self.lock:
+            if self.queue.full():
+                raise queue.Full
+            job_dir = os.path.join(self.jobs_dir, uuid.uuid4().hex[:12])
+            os.makedirs(job_dir)
+            sheet_path = None
+            if records is None:
+                sheet_path = os.path.join(job_dir, 'sheet.xlsx')
+                with open(sheet_path, 'wb') as file:
+                    file.write(body)
+            job = Job(job_dir, square, output_options, records, sheet_path)
+            self.jobs[job.id] = job
+            self.queue.put_nowait(job)
+            self._forget_old_jobs()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def all_jobs(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def counts(self):
+        jobs = self.all_jobs()
+        return {status: sum(job.status == status for job in jobs) for status in ('queued', 'running', 'done', 'failed')}
+
+    # Se conservan los últimos service_max_jobs trabajos; de los más viejos ya terminados
+    # se borran también los archivos
+    def _forget_old_jobs(self):
+        finished = [job for job in self.jobs.values() if job.status in FINISHED]
+        for job in finished[:max(0, len(self.jobs) - service_max_jobs)]:
+            del self.jobs[job.id]
+            clear_handoff(job.dir + os.sep)
+            shutil.rmtree(job.dir, ignore_errors=True)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self._run(job)
+            finally:
+                self.queue.task_done()
+
+    def _run(self, job):
+        job.status, job.started_at = 'running', datetime.now()
+        try:
+            rows = self._load(job)
+            self._fetch(job, rows)
+            self._render(job, rows)
+            job.status = 'done' if job.outputs else 'failed'
+        except Exception as e:
+            job.errors.append(f"{type(e).__name__}: {e}")
+            log_error(job.error_log_path, f"Job {job.id} failed. Reason: {traceback.format_exc()}\n")
+            job.status = 'failed'
+        finally:
+            job.stage, job.finished_at = None, datetime.now()
+            # Las imágenes decodificadas del trabajo ya no las usa nadie: no quedan retenidas
+            # en handoff.py mientras el servicio siga vivo
+            clear_handoff(job.dir + os.sep)
+            # Los tiempos de este trabajo (todo lo medido bajo su carpeta), sin tocar los de
+            # otros trabajos que corren a la vez
+            job.timings = summarize(drain(job.dir + os.sep))
+        print(f"Job {job.id} {job.status}: {len(job.outputs)} image(s), {len(job.errors)} error(s) "
+              f"in {(job.finished_at - job.started_at).total_seconds():.1f} s.")
+
+    def _load(self, job):
+        job.stage = 'loading'
+        downloaded_dir = os.path.join(job.dir, 'downloaded')
+        no_background_dir = os.path.join(job.dir, 'no_background')
+        for path in (downloaded_dir, no_background_dir, job.final_dir):
+            os.makedirs(path, exist_ok=True)
+        if job.records is not None:
+            return rows_from_records(job.records, downloaded_dir, no_background_dir)
+        rows = load_rows(job.sheet_path, downloaded_dir, no_background_dir)
+        if len(rows) > service_max_rows:
+            raise ValueError(f"{len(rows)} rows; at most {service_max_rows} per job")
+        job.rows = len(rows)
+        for index, size, problem in malformed_sizes(rows):
+            job.errors.append(f"row {index + 1}: size '{size}' with {problem}; skipped in the chips")
+        return rows
+
+    # Descarga y quita el fondo como process_images de main.py, sin barras de progreso
+    def _fetch(self, job, rows):
+        from image_processing import remove_backgrounds
+
+        job.stage = 'downloading'
+        dedup = PhotoDedup(rows)
+        unique_rows = dedup.unique_rows
+        urls = [row.url for row in unique_rows]
+        input_paths = [row.input_path for row in unique_rows]
+        background_jobs, failed = [], []
+        for i, downloaded in download_images(urls, input_paths, job.error_log_path, max_workers=download_workers, cache=self.download_cache):
+            if not downloaded:
+                failed.extend(row.index for row in dedup.url_groups[urls[i]])
+                continue
+            for row in dedup.add_download(unique_rows[i]):
+                if row.full_image:
+                    copy_atomic(row.input_path, row.output_path)
+                else:
+                    background_jobs.append((row.input_path, row.output_path))
+        job.errors.extend(f"row {i + 1}: could not download {rows[i].url}" for i in sorted(failed))
+        job.stage = 'waiting for rembg'
+        with self.rembg_slots:
+            job.stage = 'removing backgrounds'
+            remove_backgrounds(sorted(background_jobs), job.error_log_path, cache=self.result_cache, model_name=self.model_name)
+        dedup.share_results()
+
+    def _render(self, job, rows):
+        job.stage = 'rendering'
+        if job.square:
+            tasks = [RenderTask(f"square image {row.index + 1}", create_square_image, row, job.final_dir, font_path, square_template_path, job.output_options)
+                     for row in rows]
+        else:
+            tasks = [RenderTask(f"final images {i // 3 + 1}", create_final_images, rows[i:i + 3], job.final_dir, font_path, VARIANTS, job.output_options)
+                     for i in range(0, len(rows), 3)]
+        job.tasks_total = len(tasks)
+        for task in tasks:
+            try:
+                task()
+            except Exception:
+                error = traceback.format_exc()
+                job.errors.append(f"{task.label}: {error.strip().splitlines()[-1]}")
+                log_error(job.error_log_path, f"Failed to render {task.label}. Reason: {error}\n")
+            job.tasks_done += 1
+        outputs = []
+        for dir_path, _, filenames in os.walk(job.final_dir):
+            outputs.extend(os.path.relpath(os.path.join(dir_path, name), job.dir) for name in filenames)
+        job.outputs = sorted(outputs)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    def __init__(self, service, *args, **kwargs):
+        self.service = service
+        super().__init__(*args, **kwargs)
+
+    def base_url(self):
+        host = self.headers.get('Host') or '%s:%s' % self.server.server_address[:2]
+        return f"http://{host}"
+
+    def send_json(self, status, data, headers=()):
+        body = json.dumps(data, indent=1).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message, headers=()):
+        self.send_json(status, {'error': message}, headers)
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip('/')
+        parts = path.split('/', 3)
+        if path == '/health':
+            self.send_json(200, {'status': 'ok', 'workers': self.service.workers, 'jobs': self.service.counts()})
+        elif path == '/jobs':
+            self.send_json(200, {'jobs': [job.to_dict(self.base_url()) for job in self.service.all_jobs()]})
+        elif len(parts) == 3 and parts[1] == 'jobs':
+            job = self.service.get(parts[2])
+            if job is None:
+                self.send_error_json(404, f"unknown job '{parts[2]}'")
+            else:
+                self.send_json(200, job.to_dict(self.base_url()))
+        elif len(parts) == 4 and parts[1] == 'files':
+            self.send_job_file(parts[2], unquote(parts[3]))
+        else:
+            self.send_error_json(404, f"no route for {path or '/'}")
+
+    def send_job_file(self, job_id, relative_path):
+        job = self.service.get(job_id)
+        file_path = os.path.realpath(os.path.join(job.dir, relative_path)) if job else None
+        if job is None or not file_path.startswith(os.path.realpath(job.dir) + os.sep) or not os.path.isfile(file_path):
+            self.send_error_json(404, f"no file '{relative_path}' in job '{job_id}'")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', mimetypes.guess_type(file_path)[0] or 'application/octet-stream')
+        self.send_header('Content-Length', str(os.path.getsize(file_path)))
+        self.end_headers()
+        with open(file_path, 'rb') as file:
+            shutil.copyfileobj(file, self.wfile)
+
+    # Un error inesperado responde 500 en JSON en vez de cortar la conexión sin respuesta
+    def do_POST(self):
+        try:
+            self.post_job()
+        except Exception as e:
+            traceback.print_exc()
+            self.close_connection = True
+            self.send_error_json(500, f"{type(e).__name__}: {e}")
+
+    def post_job(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != '/jobs':
+            self.send_error_json(404, f"no route for {url.path}")
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self.send_error_json(411, "send the sheet or JSON rows with a Content-Length")
+            return
+        if length > service_max_upload_bytes:
+            # No se lee el cuerpo: se corta la conexión después de responder
+            self.close_connection = True
+            self.send_error_json(413, f"upload of {length} bytes; at most {service_max_upload_bytes}")
+            return
+        body = self.rfile.read(length)
+        try:
+            job = self.service.submit(body, self.headers.get('Content-Type', ''), parse_qs(url.query))
+        except ValueError as e:
+            self.send_error_json(400, str(e))
+            return
+        except queue.Full:
+            self.send_error_json(503, "too many queued jobs, try again later", [('Retry-After', '10')])
+            return
+        self.send_json(202, job.to_dict(self.base_url()), [('Location', f"/jobs/{job.id}")])
+
+    def log_message(self, format, *args):
+        # Solo los POST y los errores; el sondeo de estado ensucia la consola
+        if self.command == 'POST' or (len(args) > 1 and str(args[1])[:1] in '45'):
+            super().log_message(format, *args)
+
+def main():
+    args = parser.parse_args()
+    output_options = OutputOptions(args.format, args.compress_level, False, args.quality, False)
+    service = RenderService(service_jobs_dir, args.workers, args.max_queued, output_options, args.rembg_model, use_cache=not args.no_cache)
+    service.start()
+    server = ThreadingHTTPServer((args.host, args.port), partial(ServiceHandler, service))
+    print(f"Render service on http://{args.host}:{args.port}/ ({args.workers} worker(s), up to {args.max_queued} queued job(s))")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping render service.")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
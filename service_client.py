@@ -0,0 +1,108 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+from PIL import Image
+
+from constants import service_host, service_port
+
+# Prueba de humo de service.py: manda un trabajo, espera a que termine y comprueba que
+# cada imagen del resultado se pueda descargar y decodificar. Sale con 1 si algo falla.
+# Uso: python service_client.py [--sheet "Promos Fotos Datos.xlsx" | --rows filas.json] [--square]
+
+parser = argparse.ArgumentParser(description='Smoke-test the promo render service.')
+parser.add_argument('--url', default=f"http://{service_host}:{service_port}", help='Base URL of service.py')
+parser.add_argument('--sheet', default='Promos Fotos Datos.xlsx', help='Spreadsheet to upload')
+parser.add_argument('--rows', default=None, help='JSON file with a list of rows to send instead of the spreadsheet')
+parser.add_argument('--square', action='store_true', help='Render square images')
+parser.add_argument('--format', default=None, help='Output format(s), e.g. webp,png')
+parser.add_argument('--timeout', type=float, default=600, help='Seconds to wait for the job')
+parser.add_argument('--save', default=None, help='Directory where the images are saved (default: only checked)')
+
+def request(url, data=None, content_type=None):
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': content_type} if content_type else {})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+def submit(args):
+    if args.rows:
+        with open(args.rows) as file:
+            payload = {'rows': json.load(file), 'square': args.square}
+        if args.format:
+            payload['format'] = args.format
+        return request(f"{args.url}/jobs", json.dumps(payload).encode(), 'application/json')
+    query = {'square': 1} if args.square else {}
+    if args.format:
+        query['format'] = args.format
+    with open(args.sheet, 'rb') as file:
+        body = file.read()
+    return request(f"{args.url}/jobs?{urlencode(query)}", body, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+def wait(args, job_id):
+    deadline = time.monotonic() + args.timeout
+    last = None
+    while time.monotonic() < deadline:
+        status, body = request(f"{args.url}/jobs/{job_id}")
+        if status != 200:
+            raise RuntimeError(f"GET /jobs/{job_id} returned {status}: {body[:200]!r}")
+        job = json.loads(body)
+        progress = (job['status'], job['stage'], job['progress']['done'], job['progress']['total'])
+        if progress != last:
+            print(f"  {job['status']:<8} {job['stage'] or '':<22} {job['progress']['done']}/{job['progress']['total']}")
+            last = progress
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.5)
+    raise RuntimeError(f"job {job_id} did not finish in {args.timeout} s")
+
+def check_outputs(args, job):
+    bad = 0
+    for url in job['outputs']:
+        status, body = request(url)
+        try:
+            if status != 200:
+                raise ValueError(f"HTTP {status}")
+            Image.open(io.BytesIO(body)).verify()
+        except Exception as e:
+            print(f"❌ {url}: {e}")
+            bad += 1
+            continue
+        if args.save:
+            path = os.path.join(args.save, url.split(f"/files/{job['id']}/", 1)[1])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(body)
+    return bad
+
+def main():
+    args = parser.parse_args()
+    status, body = request(f"{args.url}/health")
+    if status != 200:
+        sys.exit(f"Service not healthy at {args.url} (HTTP {status})")
+    start = time.perf_counter()
+    status, body = submit(args)
+    if status != 202:
+        sys.exit(f"POST /jobs returned {status}: {body.decode(errors='replace')}")
+    job = json.loads(body)
+    print(f"Job {job['id']} submitted.")
+    job = wait(args, job['id'])
+    bad = check_outputs(args, job)
+
+    print(f"Job {job['id']} {job['status']} in {time.perf_counter() - start:.1f} s: "
+          f"{len(job['outputs'])} image(s), {bad} unreadable, {len(job['errors'])} error(s).")
+    for error in job['errors'][:10]:
+        print(f"  - {error}")
+    if job['status'] != 'done' or bad or not job['outputs']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
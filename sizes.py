@@ -0,0 +1,62 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+# Orden de las tallas en letras; las que no están aquí van al final
+TALLA_ORDER = {talla: rank for rank, talla in enumerate(['XXS', 'XS', 'S', 'M', 'L', 'XL', '2XL', '3XL', '4XL', '5XL'])}
+# "7...12" va de media en media talla, "38..42" de una en una
+RANGE_RE = re.compile(r'(\d+(?:\.\d+)?)(\.\.\.?)(\d+(?:\.\d+)?)')
+
+
+class SizeChips(NamedTuple):
+    kind: Optional[str]  # 'tallas', 'dimensiones' o None si no hay nada que dibujar
+    chips: Tuple[str, ...]
+    problems: Tuple[str, ...]
+
+
+def _chip_text(size):
+    return str(int(size)) if isinstance(size, float) and size.is_integer() else str(size)
+
+def _expand_range(token):
+    match = RANGE_RE.fullmatch(token)
+    if match is None:
+        raise ValueError(f"rango mal escrito '{token}'")
+    start, step, end = float(match.group(1)), match.group(2), float(match.group(3))
+    if start > end:
+        raise ValueError(f"rango invertido '{token}'")
+    if step == '...':
+        return [start + 0.5 * i for i in range(int((end - start) * 2) + 1)]
+    return list(range(int(start), int(end) + 1))
+
+def parse_sizes(size_str, type_str):
+    if type_str.lower() == 'talla':
+        return sorted(size_str.split(), key=lambda x: TALLA_ORDER.get(x, len(TALLA_ORDER))), []
+
+    size_list, problems = [], []
+    for part in size_str.split():
+        if '..' in part:
+            try:
+                size_list.extend(_expand_range(part))
+            except ValueError as e:
+                problems.append(str(e))
+        else:
+            try:
+                size_list.append(float(part))
+            except ValueError:
+                size_list.append(part)  # Handle non-numeric sizes
+    return sorted(set(size_list), key=lambda x: (isinstance(x, str), x)), problems
+
+# Lista de chips lista para dibujar; se calcula una vez por combinación (talla, tipo)
+# y se comparte entre filas y variantes (claro/oscuro, con/sin precio, cuadradas)
+@lru_cache(maxsize=None)
+def size_chips(size_str, type_str):
+    if type_str.lower() == 'dimensiones':
+        return SizeChips('dimensiones', (size_str,), ())
+    if not size_str.strip() or size_str.lower() == 'nan':
+        return SizeChips(None, (), ())
+    sizes, problems = parse_sizes(size_str, type_str)
+    return SizeChips('tallas', tuple(_chip_text(size) for size in sizes), tuple(problems))
+
+# Especificaciones de talla con errores, como [(fila, talla, problema)], para avisar antes de renderizar
+def malformed_sizes(rows):
+    return [(row.index, row.size, problem) for row in rows for problem in row.chips.problems]
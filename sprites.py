@@ -0,0 +1,43 @@
+from functools import lru_cache
+from PIL import Image, ImageDraw
+
+from assets import get_font
+from typeset import text_bbox
+
+# Chips de talla y recuadros "Válido hasta" / "Entrega" pre-renderizados en RGBA. Hay pocas
+# combinaciones distintas (texto x color x modo), así que cada una se dibuja una vez por
+# proceso y dibujar una tarjeta se reduce a unos cuantos paste() con máscara.
+# Las imágenes devueltas son compartidas: no dibujar sobre ellas.
+
+SUPERSAMPLE = 4
+
+# Rectángulo redondeado de (width x height) px dibujado a SUPERSAMPLE veces el tamaño y
+# reducido con LANCZOS para que las esquinas queden suavizadas. Ocupa width + 1 por
+# height + 1 px, igual que draw.rectangle, que incluye el borde final
+@lru_cache(maxsize=None)
+def get_box(width, height, radius, fill):
+    size = (width + 1, height + 1)
+    large = Image.new("RGBA", (size[0] * SUPERSAMPLE, size[1] * SUPERSAMPLE), (0, 0, 0, 0))
+    ImageDraw.Draw(large).rounded_rectangle(
+        (0, 0, large.width - 1, large.height - 1), radius * SUPERSAMPLE, fill=fill)
+    return large.resize(size, Image.LANCZOS)
+
+# Recuadro con el texto centrado como lo centraba el código de dibujo: (ancho - bbox) // 2
+# en cada eje, con el bbox medido desde (0, 0). El texto se dibuja a tamaño real
+@lru_cache(maxsize=None)
+def get_badge(text, font_path, font_size, width, height, fill, text_color, radius=5):
+    badge = get_box(width, height, radius, fill).copy()
+    draw = ImageDraw.Draw(badge)
+    font = get_font(font_path, font_size)
+    bbox = text_bbox(font_path, font_size, text)
+    text_x = (width - (bbox[2] - bbox[0])) // 2
+    text_y = (height - (bbox[3] - bbox[1])) // 2
+    draw.text((text_x, text_y), text, font=font, fill=text_color)
+    return badge
+
+def paste_sprite(image, sprite, xy):
+    image.paste(sprite, xy, sprite)
+
+def clear_sprites():
+    for cached in (get_box, get_badge):
+        cached.cache_clear()
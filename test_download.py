@@ -0,0 +1,65 @@
+import os
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+from PIL import Image
+
+from utils import download_images
+
+# Descargas contra un servidor HTTP local: una imagen que Pillow se niega a decodificar
+# se registra en el log de errores y se saltea, sin cortar las demás descargas
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    served = tmp_path / "served"
+    served.mkdir()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(served)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield served, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_decompression_bomb_is_logged_and_skipped(server, tmp_path):
+    served, base_url = server
+    # 14000 x 14000 px de 1 bit: unos 24 KB en disco, más del doble de Image.MAX_IMAGE_PIXELS
+    Image.new("1", (14000, 14000)).save(served / "bomb.png")
+    Image.new("RGB", (64, 48), "red").save(served / "ok.png")
+    urls = [f"{base_url}/bomb.png", f"{base_url}/ok.png"]
+    paths = [str(tmp_path / "image_0.png"), str(tmp_path / "image_1.png")]
+    error_log_path = str(tmp_path / "error_log.txt")
+
+    results = dict(download_images(urls, paths, error_log_path, max_workers=2))
+
+    assert results == {0: False, 1: True}
+    assert not os.path.exists(paths[0])
+    assert not os.path.exists(f"{paths[0]}.part")
+    with Image.open(paths[1]) as image:
+        assert image.size == (64, 48)
+    with open(error_log_path) as log_file:
+        log = log_file.read()
+    assert urls[0] in log
+    assert "DecompressionBombError" in log
+
+
+def test_heic_is_rejected_from_its_first_bytes(server, tmp_path):
+    served, base_url = server
+    # Cabecera ISO-BMFF de un HEIC: Pillow no lo abre sin pillow-heif
+    (served / "photo.heic").write_bytes(b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00" + b"\x00" * 1024 * 1024)
+    url = f"{base_url}/photo.heic"
+    path = str(tmp_path / "image_0.png")
+    error_log_path = str(tmp_path / "error_log.txt")
+
+    assert dict(download_images([url], [path], error_log_path)) == {0: False}
+    assert not os.path.exists(path)
+    with open(error_log_path) as log_file:
+        assert "unsupported image format 'heic'" in log_file.read()
@@ -0,0 +1,52 @@
+from typing import NamedTuple
+
+# Temas de las imágenes finales. Para agregar uno basta con otra entrada en THEMES:
+# el nombre también es la carpeta de salida (images/final/<tema>/...)
+
+
+class Theme(NamedTuple):
+    card_path: str
+    template_path: str                # con datos de pago
+    without_price_template_path: str  # sin datos de pago
+    logo_folder: str
+    price_color: str
+    text_color: str                   # etiqueta de tallas, chips y dimensiones
+    chip_color_men: str
+    chip_color_women: str
+    validity_color: str               # recuadro "Válido hasta"
+    delivery_color: str               # recuadro "Entrega en"
+    badge_text_color: str = "white"
+
+    def template_for(self, with_price):
+        return self.template_path if with_price else self.without_price_template_path
+
+
+THEMES = {
+    'light': Theme(
+        card_path='templates/light_card.png',
+        template_path='templates/light_template.png',
+        without_price_template_path='templates/without_price_light_template.png',
+        logo_folder='templates/logos/light',
+        price_color="#EE0701",
+        text_color="black",
+        chip_color_men="#D2EBFF",
+        chip_color_women="#FFD2EB",
+        validity_color="#FD5647",
+        delivery_color="#4FAFFB",
+    ),
+    'dark': Theme(
+        card_path='templates/dark_card.png',
+        template_path='templates/dark_template.png',
+        without_price_template_path='templates/without_price_dark_template.png',
+        logo_folder='templates/logos/dark',
+        price_color="#FF5733",
+        text_color="white",
+        chip_color_men="#2C3E50",
+        chip_color_women="#8B2CFF",
+        validity_color="#FF5733",
+        delivery_color="#3498DB",
+    ),
+}
+
+# Variantes (tema, con precio) que se generan para cada lote de 3 filas
+VARIANTS = [(theme_name, with_price) for theme_name in THEMES for with_price in (True, False)]
@@ -0,0 +1,56 @@
+from functools import lru_cache
+from PIL import Image, ImageDraw
+
+from assets import get_font
+
+# Medidas de texto memorizadas por (fuente, tamaño, texto). Los textos se repiten mucho
+# entre filas ("Entrega en 15 días aprox.", fechas de validez, tallas, precios), así que
+# cada uno se mide una vez por proceso; también se guardan el corte en líneas y el tamaño
+# de fuente que hace entrar un precio en su recuadro.
+# Las medidas son las mismas que daría draw.textbbox sobre la imagen final (RGB o RGBA)
+
+_draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+
+# bbox de text dibujado en (0, 0), como draw.textbbox((0, 0), text, font=font)
+@lru_cache(maxsize=None)
+def text_bbox(font_path, size, text):
+    return _draw.textbbox((0, 0), text, font=get_font(font_path, size))
+
+def text_width(font_path, size, text):
+    bbox = text_bbox(font_path, size, text)
+    return bbox[2] - bbox[0]
+
+def text_height(font_path, size, text):
+    bbox = text_bbox(font_path, size, text)
+    return bbox[3] - bbox[1]
+
+# Corta text por palabras en líneas de hasta max_width px; una palabra más ancha que
+# max_width queda sola en su línea. Devuelve una tupla (compartida)
+@lru_cache(maxsize=None)
+def wrap_text(font_path, size, text, max_width):
+    lines = []
+    current_line = ""
+    for word in text.split():
+        test_line = current_line + (" " if current_line else "") + word
+        if text_width(font_path, size, test_line) <= max_width:
+            current_line = test_line
+        else:
+            if current_line:
+                lines.append(current_line)
+            current_line = word
+    if current_line:
+        lines.append(current_line)
+    return tuple(lines)
+
+# Tamaño de fuente para que text entre en max_width px: max_size si ya entra, si no se
+# escala en proporción al ancho medido, sin bajar de min_size
+@lru_cache(maxsize=None)
+def fit_font_size(font_path, text, max_size, max_width, min_size=12):
+    width = text_width(font_path, max_size, text)
+    if width <= max_width:
+        return max_size
+    return max(int(max_size * (max_width / width)), min_size)
+
+def clear_typeset():
+    for cached in (text_bbox, wrap_text, fit_font_size):
+        cached.cache_clear()
@@ -1,7 +1,26 @@
 import os
+import time
+import hashlib
 import shutil
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
 from tqdm import tqdm
+from PIL import Image, features
+
+from instrumentation import record
+from handoff import keep
+from constants import download_workers, download_per_host, download_timeout, download_retries, download_backoff, download_chunk_size, download_max_bytes, download_max_dimension, download_png_compress_level
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Varios hilos escriben en el mismo error_log.txt
+_log_lock = threading.Lock()
+_host_lock = threading.Lock()
+_host_semaphores = {}
 
 def clear_directory(directory):
     for filename in os.listdir(directory):
@@ -14,20 +33,178 @@ def clear_directory(directory):
         except Exception as e:
             print(f'Failed to delete {file_path}. Reason: {e}')
 
-def download_image(url, path, error_log_path):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+def log_error(error_log_path, error_message):
+    with _log_lock:
+        with open(error_log_path, "a") as log_file:
+            log_file.write(error_message)
+
+# requests se importa recién al descargar: los renders (y los procesos del pool) no lo cargan
+def create_session(pool_size=download_workers):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # Una sola sesión con keep-alive y reintentos con backoff para todas las descargas
+    retry = Retry(
+        total=download_retries,
+        backoff_factor=download_backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "HEAD"],
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _host_semaphore(url):
+    host = urlparse(url).netloc
+    with _host_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(download_per_host)
+        return _host_semaphores[host]
+
+class DownloadError(Exception):
+    pass
+
+# Tipo real de la imagen según sus primeros bytes (la extensión y el Content-Type mienten a menudo).
+# Solo los formatos que este Pillow puede abrir: HEIC necesitaría pillow-heif, que no se usa
+def sniff_image_type(head):
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[4:12] == b"ftypavif" and features.check("avif"):
+        return "avif"
+    return None
+
+# El tipo de la imagen, o DownloadError con el motivo si no es una imagen que se pueda abrir
+def _image_kind(head, response):
+    kind = sniff_image_type(head)
+    if kind is not None:
+        return kind
+    content_type = response.headers.get("Content-Type", "unknown")
+    if head[4:8] == b"ftyp":
+        brand = head[8:12].decode("ascii", "replace")
+        raise DownloadError(f"unsupported image format '{brand}' (Content-Type: {content_type})")
+    raise DownloadError(f"response is not a supported image (Content-Type: {content_type})")
+
+# Escribe el cuerpo por bloques en tmp_path, calculando el hash y cortando si supera max_bytes.
+# El tipo se mira con los primeros bytes: un formato que no se puede abrir no se baja entero
+def _stream_to_file(response, tmp_path, max_bytes):
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise DownloadError(f"image is {int(length)} bytes, larger than the {max_bytes} byte limit")
+    digest = hashlib.sha256()
+    head = b""
+    kind = None
+    total = 0
+    with open(tmp_path, "wb") as file:
+        for chunk in response.iter_content(chunk_size=download_chunk_size):
+            total += len(chunk)
+            if total > max_bytes:
+                raise DownloadError(f"image is larger than the {max_bytes} byte limit")
+            if kind is None:
+                head += chunk[:16 - len(head)]
+                if len(head) == 16:
+                    kind = _image_kind(head, response)
+            digest.update(chunk)
+            file.write(chunk)
+    if kind is None:
+        kind = _image_kind(head, response)
+    return digest.hexdigest(), total, kind
+
+# Deja en path un PNG real, reducido una sola vez al tamaño máximo que necesitan las plantillas,
+# y lo escribe de una vez (temporal + rename): una descarga cortada nunca queda a medias.
+# Los JPEG se decodifican directamente a escala reducida con draft()
+def normalize_image(source_path, path, kind, max_dimension=download_max_dimension):
+    tmp_path = f"{path}.tmp"
     try:
+        with Image.open(source_path) as image:
+            if kind == "png" and max(image.size) <= max_dimension:
+                image.close()
+                os.replace(source_path, path)
+                return
+            if kind == "jpeg":
+                image.draft("RGB", (max_dimension, max_dimension))
+            if image.mode not in ("RGB", "RGBA"):
+                has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+                image = image.convert("RGBA" if has_alpha else "RGB")
+            if max(image.size) > max_dimension:
+                image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            image.save(tmp_path, "PNG", compress_level=download_png_compress_level)
+        os.replace(tmp_path, path)
+        os.unlink(source_path)
+        # Ya decodificada: rembg la toma de memoria en vez de volver a leer el PNG
+        keep(path, image)
+    except OSError:
+        raise
+    except Exception as e:
+        # Pillow también falla con errores que no son OSError (p. ej. DecompressionBombError
+        # con una imagen de 14000x14000 px): la URL se registra y se saltea como cualquier otra
+        raise DownloadError(f"image could not be decoded ({type(e).__name__}: {e})") from e
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def download_image(url, path, error_log_path, session=None, cache=None):
+    import requests
+    start = time.perf_counter()
+    tmp_path = f"{path}.part"
+    try:
+        entry = cache.lookup(url) if cache else None
+        if entry and cache.is_fresh(entry):
+            cache.materialize(entry, path)
+            record('download.cache_hit', time.perf_counter() - start, path, os.path.getsize(path))
+            return True
+
         tqdm.write(f"Downloading image from {url[:50]}...")
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        with open(path, "wb") as file:
-            file.write(response.content)
+        headers = cache.conditional_headers(entry) if entry else {}
+        with _host_semaphore(url):
+            if session is None:
+                response = requests.get(url, headers={**HEADERS, **headers}, timeout=download_timeout, stream=True)
+            else:
+                response = session.get(url, headers=headers, timeout=download_timeout, stream=True)
+            with response:
+                if entry and response.status_code == 304:
+                    cache.materialize(cache.revalidated(url, entry), path)
+                    record('download.not_modified', time.perf_counter() - start, path, os.path.getsize(path))
+                    return True
+                response.raise_for_status()
+                sha256, nbytes, kind = _stream_to_file(response, tmp_path, download_max_bytes)
+
+        normalize_image(tmp_path, path, kind)
+        if cache:
+            cache.store(url, path, sha256, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        record('download', time.perf_counter() - start, path, nbytes)
         return True
-    except requests.RequestException as e:
+    except (requests.RequestException, OSError, DownloadError) as e:
         error_message = f"Failed to download image from {url}. Reason: {e}\n\n"
-        with open(error_log_path, "a") as log_file:
-            log_file.write(error_message)
+        log_error(error_log_path, error_message)
         tqdm.write(error_message.strip())
         return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+# Descarga en paralelo y va entregando (i, ok) a medida que terminan
+def download_images(urls, paths, error_log_path, max_workers=download_workers, cache=None):
+    session = create_session(max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(download_image, url, paths[i], error_log_path, session, cache): i
+                for i, url in enumerate(urls)
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    finally:
+        session.close()
+        if cache:
+            cache.save()
@@ -0,0 +1,41 @@
+import os
+import time
+
+# Vigilancia por sondeo (sin dependencias): se compara (mtime, tamaño) de cada archivo.
+# Alcanza para una planilla y unas decenas de plantillas, fuentes y logos
+
+def snapshot(paths):
+    state = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in os.walk(path):
+                for filename in filenames:
+                    _stat(os.path.join(root, filename), state)
+        else:
+            _stat(path, state)
+    return state
+
+def _stat(path, state):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return
+    state[path] = (stat.st_mtime_ns, stat.st_size)
+
+def changed_paths(old, new):
+    return sorted(path for path in old.keys() | new.keys() if old.get(path) != new.get(path))
+
+# Bloquea hasta que algo cambie y se quede quieto un intervalo (Excel y los editores de
+# imágenes escriben en varios pasos). Devuelve (rutas cambiadas, nuevo estado)
+def wait_for_change(paths, state, interval):
+    while True:
+        time.sleep(interval)
+        current = snapshot(paths)
+        if current == state:
+            continue
+        while True:
+            time.sleep(interval)
+            settled = snapshot(paths)
+            if settled == current:
+                return changed_paths(state, current), current
+            current = settled